@@ -40,28 +40,54 @@ from src.services.story_generator import StoryGenerator
 from src.services.experience_calculator import ExperienceCalculator
 from src.services.task_service import TaskService
 from src.models.types import TaskStatus, StoryPhase, Task, Story, Season, User, ErrorMessages
-from src.utils.encoders import custom_json_response
+from src.utils.encoders import CustomORJSONResponse
+from src.utils.cache import TTLCache
 from src.services.season_service import SeasonService
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from src.services.story_service import StoryService
-from src.utils.firebase_config import db
+from src.utils.firebase_config import db as firebase_db, warm_up_firestore
 from src.utils.auth_middleware import verify_token
 from src.services.rate_limiter import RateLimiter
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 import logging
 import time
+import asyncio
 from collections import defaultdict
 from google.cloud.firestore import FieldFilter
+from google.api_core.exceptions import AlreadyExists
 from src.services.image_generator import ImageGenerator
 from src.services.storage_service import StorageService
+from src.utils.vertex_client import warm_up_models
 
 # 環境変数の読み込み
 load_dotenv()
 
+# ユーザー情報キャッシュの有効期間（秒）
+USER_CACHE_TTL = 10
+
+# ストーリー一覧の1ページあたりの件数
+STORIES_PAGE_SIZE = 50
+STORIES_MAX_PAGE_SIZE = 100
+# 一覧表示用に取得するストーリーのフィールド（本文などは含めない）
+STORY_SUMMARY_FIELDS = ['id', 'season_id', 'chapter_no', 'title', 'summary', 'phase', 'created_at']
+
 # 環境変数で本番/テスト/開発環境を切り替え
 environment = os.getenv("ENVIRONMENT", "development")
 is_development = environment == "development"
 
+# リクエストごとに読み込まないよう起動時に一度だけ取得（未設定の場合は起動時にエラー）
+GCS_BUCKET_NAME = os.environ["GCS_BUCKET_NAME"]
+# CORSMiddlewareはオリジンを `in` で判定するため、setにしてO(1)で照合できるようにする
+# 空要素（末尾の「|」など）や前後の空白は除外し、未設定の場合は開発環境のみローカルのフロントエンドを許可
+ALLOWED_ORIGINS = frozenset(
+    origin.strip() for origin in (os.getenv("ALLOWED_ORIGINS") or "").split("|") if origin.strip()
+)
+if not ALLOWED_ORIGINS:
+    if not is_development:
+        raise RuntimeError("ALLOWED_ORIGINS が設定されていません")
+    ALLOWED_ORIGINS = frozenset({"http://localhost:4200"})
+
 # ロギングの設定を修正
 logging.basicConfig(
     level=logging.DEBUG if is_development else logging.INFO,
@@ -76,8 +102,8 @@ def initialize_firebase():
     """
     Firebase/Firestoreの初期化を行う
     
-    Google Cloud認証情報を使用してFirestoreクライアントを初期化し、
-    開発環境では接続テストも実行します。
+    Google Cloud認証情報を読み込み、Firebase Admin SDKが初期化済みの
+    Firestoreクライアントを取得します。開発環境では接続テストも実行します。
     
     Returns:
         Tuple[Optional[firestore.Client], Optional[service_account.Credentials]]: 
@@ -93,8 +119,9 @@ def initialize_firebase():
             os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
         )
         
-        # Firestoreクライアントの初期化
-        db = firestore.Client(credentials=cred)
+        # Firestoreクライアントは Firebase Admin SDK のものを共有する
+        # （同じ認証情報で別のクライアントを作るとgRPCチャネルが二重になるため）
+        db = firebase_db
         
         # 接続テストは本番環境ではスキップ
         if is_development:
@@ -104,11 +131,13 @@ def initialize_firebase():
         
         return db, cred
     except Exception as e:
-        logger.error(f"Error initializing Firebase: {str(e)}")
+        logger.error("Error initializing Firebase: %s", e)
         # エラーをログに記録するが、アプリケーションは起動を継続
         return None, None
 
 # アプリケーションの初期化
+# Firebase初期化失敗時の限定モードではレート制限を行わない
+rate_limiter = None
 try:
     db, cred = initialize_firebase()
     if db is None or cred is None:
@@ -117,7 +146,8 @@ try:
         app = FastAPI(
             title="ToDo Chronicle API",
             description="ToDo Chronicle API (Limited Mode)",
-            version="1.0.0"
+            version="1.0.0",
+            default_response_class=CustomORJSONResponse
         )
     else:
         # 各サービスの初期化
@@ -138,33 +168,39 @@ try:
                 version="1.0.0",
                 docs_url="/docs",
                 redoc_url="/redoc",
-                debug=True
+                debug=True,
+                default_response_class=CustomORJSONResponse
             )
         else:
             app = FastAPI(
                 title="ToDo Chronicle API",
                 description="ToDo Chronicle API",
-                version="1.0.0"
+                version="1.0.0",
+                default_response_class=CustomORJSONResponse
             )
 except Exception as e:
-    logger.error(f"Error during application initialization: {str(e)}")
+    logger.error("Error during application initialization: %s", e)
     # 基本的な機能のみでアプリケーションを起動
     app = FastAPI(
         title="ToDo Chronicle API",
         description="ToDo Chronicle API (Limited Mode)",
-        version="1.0.0"
+        version="1.0.0",
+        default_response_class=CustomORJSONResponse
     )
 
 # CORSの設定
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=os.getenv("ALLOWED_ORIGINS").split("|"),
+    allow_origins=ALLOWED_ORIGINS,
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-    allow_headers=["*"],
+    allow_headers=["authorization", "content-type"],
     expose_headers=["*"]
 )
 
+# レスポンスの圧縮（ダッシュボードやストーリー一覧など1KB以上のレスポンスのみ）
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
+
 def rate_limit(endpoint: str):
     """
     レート制限の依存関係を生成する
@@ -181,24 +217,55 @@ def rate_limit(endpoint: str):
     Raises:
         HTTPException: レート制限を超過した場合（429エラー）
     """
+    # 制限値とエラーメッセージはリクエストごとに組み立てず、生成時に一度だけ計算する
+    # （Firebase初期化失敗時の限定モードではrate_limiterがNone）
+    limit_val = rate_limiter.get_limit(endpoint) if rate_limiter is not None else 0
+    detail = f"レート制限を超過しました。1分間に{limit_val}回までリクエスト可能です。"
+
     async def dependency(request: Request):
         # OPTIONSリクエストはレート制限をスキップ
         if request.method == "OPTIONS":
             return
             
         # クライアントのIPアドレスを取得
-        client_ip = request.client.host if request.client else "127.0.0.1"
+        client_ip = getattr(request.client, "host", "127.0.0.1")
         
-        try:
-            if rate_limiter.check_limit(client_ip, endpoint):
-                raise HTTPException(
-                    status_code=429,
-                    detail=f"レート制限を超過しました。1分間に{rate_limiter.get_limit(endpoint)}回までリクエスト可能です。"
-                )
-        except HTTPException as e:
-            raise e
+        if rate_limiter is not None and rate_limiter.check_limit(client_ip, endpoint):
+            raise HTTPException(status_code=429, detail=detail)
     return dependency
 
+# エンドポイントごとのレート制限依存関係（同一の関数オブジェクトを再利用する）
+_RL_DEPS = {
+    endpoint: rate_limit(endpoint)
+    for endpoint in [
+        "user_create",
+        "GET_user",
+        "GET_dashboard",
+        "GET_tasks",
+        "task_create",
+        "task_update",
+        "task_delete",
+        "task_status_update",
+        "exp_update",
+    ]
+}
+
+# 起動時のウォームアップタスク（GCで破棄されないよう参照を保持する）
+_background_tasks = set()
+
+@app.on_event("startup")
+async def warm_up_clients():
+    """
+    起動時にVertex AIとFirestoreへの接続をバックグラウンドで確立する
+    
+    最初のリクエストで接続確立の待ち時間が発生しないようにします。
+    起動処理自体はウォームアップの完了を待ちません。
+    """
+    for coro in (warm_up_models(), asyncio.to_thread(warm_up_firestore)):
+        task = asyncio.create_task(coro)
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+
 # グローバルエラーハンドラー
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
@@ -215,7 +282,7 @@ async def global_exception_handler(request: Request, exc: Exception):
     Returns:
         JSONResponse: エラー情報を含むJSONレスポンス
     """
-    logger.error(f"Global error: {exc}")
+    logger.error("Global error: %s", exc)
     if is_development:
         return JSONResponse(
             status_code=500,
@@ -230,6 +297,24 @@ async def global_exception_handler(request: Request, exc: Exception):
         content={"message": "Internal server error"}
     )
 
+# ヘルスチェック用タイムスタンプのキャッシュ（[生成時刻, ISO形式文字列]）
+_health_timestamp = [0.0, ""]
+
+def _now_iso() -> str:
+    """
+    現在時刻のISO形式文字列を1秒単位でキャッシュして返す
+    
+    ヘルスチェックは高頻度で呼ばれるため、毎回datetimeを生成・整形しないようにします。
+    
+    Returns:
+        str: ISO形式のタイムスタンプ（最大1秒前の時刻）
+    """
+    now = time.time()
+    if now - _health_timestamp[0] >= 1.0:
+        _health_timestamp[0] = now
+        _health_timestamp[1] = datetime.fromtimestamp(now).isoformat()
+    return _health_timestamp[1]
+
 @app.get("/health")
 async def health_check():
     """
@@ -249,7 +334,7 @@ async def health_check():
     return {
         "status": "healthy",
         "environment": environment,
-        "timestamp": datetime.now().isoformat()
+        "timestamp": _now_iso()
     }
 
 @app.get("/")
@@ -278,12 +363,42 @@ def handle_error(e: Exception, error_message: str):
     Raises:
         HTTPException: 適切なHTTPステータスコードとエラーメッセージ
     """
-    logger.error(f"{error_message}: {str(e)}")
+    logger.error("%s: %s", error_message, e)
     if isinstance(e, HTTPException):
         raise e
     raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/users", dependencies=[Depends(rate_limit("user_create"))])
+# ユーザー情報のキャッシュ（短時間の連続アクセスでFirestoreの読み込みをまとめる）
+user_cache = TTLCache()
+
+async def get_user_dict(user_id: str) -> Optional[Dict]:
+    """
+    ユーザー情報を取得する（キャッシュ付き）
+    
+    同一ユーザーへの同時リクエストは1回のFirestore読み込みにまとめられます。
+    ユーザー情報を更新する処理ではinvalidate_user_cacheを呼び出してください。
+    
+    Args:
+        user_id (str): ユーザーID
+        
+    Returns:
+        Optional[Dict]: ユーザー情報（存在しない場合はNone）
+    """
+    async def fetch_user() -> Optional[Dict]:
+        user_doc = await asyncio.to_thread(db.collection('users').document(user_id).get)
+        return user_doc.to_dict() if user_doc.exists else None
+    return await user_cache.get_or_fetch(f"user:{user_id}", USER_CACHE_TTL, fetch_user)
+
+def invalidate_user_cache(user_id: str) -> None:
+    """
+    ユーザー情報のキャッシュを無効化する
+    
+    Args:
+        user_id (str): ユーザーID
+    """
+    user_cache.invalidate(f"user:{user_id}")
+
+@app.post("/users", response_model=None, dependencies=[Depends(_RL_DEPS["user_create"])])
 async def create_user(user: User, user_id: str = Depends(verify_token)):
     """
     ユーザー作成エンドポイント
@@ -304,35 +419,37 @@ async def create_user(user: User, user_id: str = Depends(verify_token)):
             }
             
     Raises:
-        HTTPException: ユーザー作成に失敗した場合（500エラー）
+        HTTPException: ユーザーが既に存在する場合（409エラー）、
+                      ユーザー作成に失敗した場合（500エラー）
     """
     try:
-        logger.info(f"ユーザーID: {user_id}")
+        logger.info("ユーザーID: %s", user_id)
         # 認証されたユーザーIDを使用してユーザーを作成
         user_ref = db.collection('users').document(user_id)
         user.id = user_id
-        user_dict = user.model_dump()
-        user_dict['created_at'] = datetime.now()
-        user_dict['current_season_id'] = None
-        user_dict['season_ids'] = []
-        logger.info(f"ユーザー作成: {user_dict}")
-        
-        user_ref.set(user_dict)
-        saved_user = user_ref.get()
+        user.current_season_id = None
+        user.season_ids = []
         
-        if not saved_user.exists:
-            raise HTTPException(status_code=500, detail=ErrorMessages.USER_CREATION_FAILED)
-        
-        # 初期シーズンを作成
+        # 初期シーズンを作成（current_season_id / season_idsもここで設定される）
         season, updated_user = await season_service.create_initial_season(user)
-        
-        # シーズンをユーザーのサブコレクションとして保存
-        season_ref = user_ref.collection('seasons').document(season.id)
+        user_dict = updated_user.model_dump()
         season_dict = season.model_dump()
-        season_ref.set(season_dict)
+        logger.info("ユーザー作成: %s", user_dict)
+        
+        # ユーザーと初期シーズン（サブコレクション）を1回のバッチ書き込みで保存
+        # コミットが例外なく完了すれば両方が書き込まれているため、再読み込みによる確認は行わない
+        # ユーザーはcreateで作成し、既存ユーザーを上書きしないようにする
+        batch = db.batch()
+        batch.create(user_ref, user_dict)
+        batch.set(user_ref.collection('seasons').document(season.id), season_dict)
+        try:
+            await asyncio.to_thread(batch.commit)
+        except AlreadyExists:
+            raise HTTPException(status_code=409, detail=ErrorMessages.USER_ALREADY_EXISTS)
+        invalidate_user_cache(user_id)
         
         # ダッシュボード形式のレスポンスを構築（user_idを除外）
-        user_response = updated_user.model_dump()
+        user_response = dict(user_dict)
         user_response.pop('id', None)  # user_idを除外
         
         response = {
@@ -341,11 +458,11 @@ async def create_user(user: User, user_id: str = Depends(verify_token)):
             "seasons": [season_dict]
         }
         
-        return custom_json_response(response)
+        return CustomORJSONResponse(content=response)
     except Exception as e:
         handle_error(e, "ユーザー作成エラー")
 
-@app.get("/users/me", dependencies=[Depends(rate_limit("GET_user"))])
+@app.get("/users/me", response_model=None, dependencies=[Depends(_RL_DEPS["GET_user"])])
 async def get_user(user_id: str = Depends(verify_token)):
     """
     ユーザー取得エンドポイント
@@ -362,18 +479,16 @@ async def get_user(user_id: str = Depends(verify_token)):
         HTTPException: ユーザーが見つからない場合（404エラー）
     """
     try:
-        logger.info(f"/users/me: {user_id}")
-        user_ref = db.collection('users').document(user_id)
-        user_doc = user_ref.get()
-        if not user_doc.exists:
+        logger.info("/users/me: %s", user_id)
+        user_dict = await get_user_dict(user_id)
+        if user_dict is None:
             raise HTTPException(status_code=404, detail=ErrorMessages.USER_NOT_FOUND)
         
-        user_dict = user_doc.to_dict()
-        return custom_json_response(user_dict)
+        return CustomORJSONResponse(content=user_dict)
     except Exception as e:
         handle_error(e, "ユーザー取得エラー")
 
-@app.get("/users/me/dashboard", dependencies=[Depends(rate_limit("GET_dashboard"))])
+@app.get("/users/me/dashboard", response_model=None, dependencies=[Depends(_RL_DEPS["GET_dashboard"])])
 async def get_dashboard(user_id: str = Depends(verify_token)):
     """
     ダッシュボード取得エンドポイント
@@ -395,19 +510,37 @@ async def get_dashboard(user_id: str = Depends(verify_token)):
         HTTPException: ユーザーが見つからない場合（404エラー）
     """
     try:
-        logger.info(f"/users/me/dashboard: {user_id}")
+        logger.info("/users/me/dashboard: %s", user_id)
         user_ref = db.collection('users').document(user_id)
-        user = user_ref.get()
-        if not user.exists:
+
+        async def get_user_and_current_stories() -> Tuple[Optional[Dict], List[Dict]]:
+            # 現在のシーズンのストーリーはユーザー情報の取得後すぐに読み始める
+            user_dict = await get_user_dict(user_id)
+            if user_dict is None:
+                return None, []
+            current_season_id = user_dict.get('current_season_id')
+            if current_season_id not in user_dict.get('season_ids', []):
+                return user_dict, []
+            stories = await asyncio.to_thread(
+                season_service.get_stories_for_dashboard, user_ref, current_season_id
+            )
+            return user_dict, stories
+
+        # ユーザー（とストーリー）・タスク・シーズンは互いに依存しないため並行して取得
+        (user_dict, current_stories), tasks_list, seasons = await asyncio.gather(
+            get_user_and_current_stories(),
+            asyncio.to_thread(task_service.get_tasks_for_dashboard, user_ref),
+            asyncio.to_thread(season_service.get_seasons_for_dashboard, user_ref)
+        )
+        if user_dict is None:
             raise HTTPException(status_code=404, detail=ErrorMessages.USER_NOT_FOUND)
         
-        user_dict = user.to_dict()
-        
-        # タスクの取得
-        tasks_list = task_service.get_tasks_for_dashboard(user_ref)
-        
-        # シーズンの取得
-        seasons = season_service.get_seasons_for_dashboard(user_ref, user_dict.get('season_ids', []))
+        # ユーザーに紐づくシーズンのみを対象とし、現在のシーズンにだけストーリーを含める
+        season_ids = set(user_dict.get('season_ids', []))
+        current_season_id = user_dict.get('current_season_id')
+        seasons = [season for season in seasons if season.get('id') in season_ids]
+        for season in seasons:
+            season['stories'] = current_stories if season.get('id') == current_season_id else []
         
         # レスポンスの構築
         response = {
@@ -415,11 +548,11 @@ async def get_dashboard(user_id: str = Depends(verify_token)):
             "tasks": tasks_list,
             "seasons": seasons
         }
-        return custom_json_response(response)
+        return CustomORJSONResponse(content=response)
     except Exception as e:
         handle_error(e, "ダッシュボード取得エラー")
 
-@app.get("/users/me/tasks", dependencies=[Depends(rate_limit("GET_tasks"))])
+@app.get("/users/me/tasks", response_model=None, dependencies=[Depends(_RL_DEPS["GET_tasks"])])
 async def get_tasks(user_id: str = Depends(verify_token)):
     """
     タスク一覧取得エンドポイント
@@ -433,14 +566,16 @@ async def get_tasks(user_id: str = Depends(verify_token)):
         List[Dict]: タスク一覧（各タスクはTaskモデルの形式）
     """
     try:
-        logger.debug(f"タスク一覧取得: {user_id}")
-        tasks = task_service.get_tasks(user_id)
-        logger.debug(f"タスク一覧: {tasks}")
-        return [task.model_dump() for task in tasks]
+        logger.debug("タスク一覧取得: %s", user_id)
+        tasks = await asyncio.to_thread(task_service.get_tasks, user_id)
+        # タスク一覧全体のログは出力されない場合に引数の評価も避ける
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("タスク一覧: %s", tasks)
+        return CustomORJSONResponse(content=tasks)
     except Exception as e:
         handle_error(e, "タスク一覧取得エラー")
 
-@app.post("/users/me/tasks", dependencies=[Depends(rate_limit("task_create"))])
+@app.post("/users/me/tasks", dependencies=[Depends(_RL_DEPS["task_create"])])
 async def create_task(task: Task, user_id: str = Depends(verify_token)):
     """
     タスク作成エンドポイント
@@ -459,13 +594,13 @@ async def create_task(task: Task, user_id: str = Depends(verify_token)):
         HTTPException: タスク作成に失敗した場合（500エラー）
     """
     try:
-        logger.info(f"タスク作成: {user_id}")
+        logger.info("タスク作成: %s", user_id)
         created_task = await task_service.create_task(task, user_id)
-        return custom_json_response(created_task.model_dump())
+        return Response(content=created_task.model_dump_json(), media_type="application/json")
     except Exception as e:
         handle_error(e, "タスク作成エラー")
 
-@app.put("/users/me/tasks/{task_id}", dependencies=[Depends(rate_limit("task_update"))])
+@app.put("/users/me/tasks/{task_id}", dependencies=[Depends(_RL_DEPS["task_update"])])
 async def update_task(task_id: str, task: Task, user_id: str = Depends(verify_token)):
     """
     タスク更新エンドポイント
@@ -484,14 +619,14 @@ async def update_task(task_id: str, task: Task, user_id: str = Depends(verify_to
         HTTPException: タスクが見つからない場合（404エラー）または更新に失敗した場合（500エラー）
     """
     try:
-        logger.info(f"タスク更新: task_id={task_id}, user_id={user_id}")
+        logger.info("タスク更新: task_id=%s, user_id=%s", task_id, user_id)
         task.id = task_id
         result = await task_service.update_task(task, user_id)
-        return result
+        return Response(content=result.model_dump_json(), media_type="application/json")
     except Exception as e:
         handle_error(e, "タスク更新エラー")
 
-@app.delete("/users/me/tasks/{task_id}", dependencies=[Depends(rate_limit("task_delete"))])
+@app.delete("/users/me/tasks/{task_id}", dependencies=[Depends(_RL_DEPS["task_delete"])])
 async def delete_task(task_id: str, user_id: str = Depends(verify_token)):
     """
     タスク削除エンドポイント
@@ -506,13 +641,13 @@ async def delete_task(task_id: str, user_id: str = Depends(verify_token)):
         HTTPException: タスクが見つからない場合（404エラー）または削除に失敗した場合（500エラー）
     """
     try:
-        logger.info(f"タスク削除リクエスト: task_id={task_id}, user_id={user_id}")
-        task_service.delete_task(task_id, user_id)
-        logger.info(f"タスク削除成功: task_id={task_id}")
+        logger.info("タスク削除リクエスト: task_id=%s, user_id=%s", task_id, user_id)
+        await asyncio.to_thread(task_service.delete_task, task_id, user_id)
+        logger.info("タスク削除成功: task_id=%s", task_id)
     except Exception as e:
         handle_error(e, "タスク削除エラー")
 
-@app.put("/users/me/tasks/{task_id}/status", dependencies=[Depends(rate_limit("task_status_update"))])
+@app.put("/users/me/tasks/{task_id}/status", dependencies=[Depends(_RL_DEPS["task_status_update"])])
 async def update_task_status(task_id: str, status_update: dict, user_id: str = Depends(verify_token)):
     """
     タスクステータス更新エンドポイント
@@ -538,13 +673,13 @@ async def update_task_status(task_id: str, status_update: dict, user_id: str = D
         if status is None:
             raise HTTPException(status_code=400, detail="status is required")
             
-        logger.info(f"タスクステータス更新: task_id={task_id}, status={status}, user_id={user_id}")
-        result = task_service.update_task_status(task_id, status, user_id)
-        return result
+        logger.info("タスクステータス更新: task_id=%s, status=%s, user_id=%s", task_id, status, user_id)
+        result = await asyncio.to_thread(task_service.update_task_status, task_id, status, user_id)
+        return Response(content=result.model_dump_json(), media_type="application/json")
     except Exception as e:
         handle_error(e, "タスクステータス更新エラー")
 
-@app.put("/users/me/experience", dependencies=[Depends(rate_limit("exp_update"))])
+@app.put("/users/me/experience", response_model=None, dependencies=[Depends(_RL_DEPS["exp_update"])])
 async def update_user_experience(user_id: str = Depends(verify_token)):
     """
     ユーザー経験値更新エンドポイント
@@ -571,50 +706,100 @@ async def update_user_experience(user_id: str = Depends(verify_token)):
     """
     try:
         result = await season_service.progress_story(user_id)
-        return custom_json_response(result)
+        return CustomORJSONResponse(content=result)
     except Exception as e:
         handle_error(e, "経験値更新エラー")
+    finally:
+        # 途中で失敗した場合もユーザー情報が更新されている可能性があるため無効化する
+        invalidate_user_cache(user_id)
 
-@app.get("/users/me/seasons/{season_id}/stories")
-async def get_season_stories(user_id: str = Depends(verify_token), season_id: str = None):
+@app.get("/users/me/seasons/{season_id}/stories", response_model=None)
+async def get_season_stories(
+    user_id: str = Depends(verify_token),
+    season_id: str = None,
+    limit: int = Query(STORIES_PAGE_SIZE, ge=1, le=STORIES_MAX_PAGE_SIZE),
+    cursor: Optional[int] = Query(None, description="前ページの next_cursor（この章番号より前の章を取得）"),
+    summary_only: bool = Query(False, description="一覧表示用の項目のみを返す（本文は個別取得APIで取得）")
+):
     """
     シーズンのストーリー一覧取得エンドポイント
     
-    指定されたシーズンの全ストーリーを取得します。
-    ストーリーは章番号の降順でソートされます。
+    指定されたシーズンのストーリーを取得します。
+    ストーリーは章番号の降順でソートされ、1回のリクエストで最大limit件を返します。
     
     Args:
         user_id (str): 認証から取得したユーザーID
         season_id (str): 取得するシーズンのID
+        limit (int): 取得する最大件数
+        cursor (Optional[int]): 前ページ最後の章番号（指定時はその次の章から取得）
+        summary_only (bool): Trueの場合は章番号・タイトル・要約などの一覧表示用項目のみを返す
         
     Returns:
         Dict: ストーリー一覧
             {
-                "stories": List[Dict]  # ストーリー一覧（章番号降順）
+                "stories": List[Dict],         # ストーリー一覧（章番号降順）
+                "next_cursor": Optional[int]   # 続きがある場合の次ページ用カーソル
             }
             
     Raises:
-        HTTPException: ユーザーまたはシーズンが見つからない場合（404エラー）
+        HTTPException: シーズンが見つからない場合（404エラー）
     """
     try:
+        # ユーザーは認証済みのため存在確認は行わず、シーズンの存在のみ確認する
+        # （ユーザーが存在しなければシーズンも存在しないため404になる）
         user_ref = db.collection('users').document(user_id)
-        user = user_ref.get()
-        if not user.exists:
-            raise HTTPException(status_code=404, detail=ErrorMessages.USER_NOT_FOUND)
-        
         season_ref = user_ref.collection('seasons').document(season_id)
-        season = season_ref.get()
-        if not season.exists:
-            raise HTTPException(status_code=404, detail=ErrorMessages.SEASON_NOT_FOUND)
         
         stories_ref = season_ref.collection('stories')
-        # chapter_noの降順でストーリーを取得
-        stories = stories_ref.order_by('chapter_no', direction=firestore.Query.DESCENDING).stream()
-        stories_list = [doc.to_dict() for doc in stories]
-        return custom_json_response({"stories": stories_list})
+        # chapter_noの降順でストーリーを取得（streamの読み出しもブロッキングのためスレッドで実行）
+        stories_query = stories_ref.select(STORY_SUMMARY_FIELDS) if summary_only else stories_ref
+        stories_query = stories_query.order_by('chapter_no', direction=firestore.Query.DESCENDING)
+        if cursor is not None:
+            stories_query = stories_query.start_after({'chapter_no': cursor})
+        stories_query = stories_query.limit(limit)
+        
+        # シーズンの存在確認とストーリーの取得を並行して実行
+        season, stories_list = await asyncio.gather(
+            asyncio.to_thread(season_ref.get),
+            asyncio.to_thread(lambda: [doc.to_dict() for doc in stories_query.stream()])
+        )
+        if not season.exists:
+            raise HTTPException(status_code=404, detail=ErrorMessages.SEASON_NOT_FOUND)
+        next_cursor = stories_list[-1].get('chapter_no') if len(stories_list) == limit else None
+        return CustomORJSONResponse(content={"stories": stories_list, "next_cursor": next_cursor})
     except Exception as e:
         handle_error(e, "シーズンのストーリー一覧取得エラー")
 
+@app.get("/users/me/seasons/{season_id}/stories/{story_id}", response_model=None)
+async def get_season_story(season_id: str, story_id: str, user_id: str = Depends(verify_token)):
+    """
+    ストーリー取得エンドポイント
+    
+    指定されたストーリーを本文を含めて取得します。
+    一覧を summary_only で取得した場合の本文取得に使用します。
+    
+    Args:
+        season_id (str): シーズンID
+        story_id (str): ストーリーID
+        user_id (str): 認証から取得したユーザーID
+        
+    Returns:
+        Dict: ストーリー情報
+        
+    Raises:
+        HTTPException: ストーリーが見つからない場合（404エラー）
+    """
+    try:
+        story_ref = db.collection('users').document(user_id)\
+            .collection('seasons').document(season_id)\
+            .collection('stories').document(story_id)
+        story = await asyncio.to_thread(story_ref.get)
+        if not story.exists:
+            raise HTTPException(status_code=404, detail=ErrorMessages.STORY_NOT_FOUND)
+        return CustomORJSONResponse(content=story.to_dict())
+    except Exception as e:
+        handle_error(e, "ストーリー取得エラー")
+
 @app.get("/users/me/seasons/{season_id}/story-image-url")
 async def get_story_image_url(season_id: str, user_id: str = Depends(verify_token)):
     """
@@ -642,7 +827,8 @@ async def get_story_image_url(season_id: str, user_id: str = Depends(verify_toke
         # Firestoreからファイル名を取得
         user_ref = db.collection('users').document(user_id)
         season_ref = user_ref.collection('seasons').document(season_id)
-        season_doc = season_ref.get()
+        # 画像ファイル名のみが必要なため、そのフィールドだけを取得する
+        season_doc = await asyncio.to_thread(season_ref.get, field_paths=['story_image_filename'])
         if not season_doc.exists:
             raise HTTPException(status_code=404, detail="シーズンが見つかりません")
         season_data = season_doc.to_dict()
@@ -651,12 +837,11 @@ async def get_story_image_url(season_id: str, user_id: str = Depends(verify_toke
             raise HTTPException(status_code=404, detail="画像ファイル名が未設定です")
 
         # StorageServiceで署名付きURL生成
-        bucket_name = os.getenv("GCS_BUCKET_NAME")
         storage_path = f"images/user_{user_id}/{filename}"
-        url = await storage_service.get_signed_url(bucket_name, storage_path, expiration=300)
+        url = await storage_service.get_signed_url(GCS_BUCKET_NAME, storage_path, expiration=300)
         return {"url": url}
     except Exception as e:
-        logger.error(f"ストーリー画像URL取得エラー: {str(e)}")
+        logger.error("ストーリー画像URL取得エラー: %s", e)
         handle_error(e, "ストーリー画像URL取得エラー")
 
 
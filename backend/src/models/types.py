@@ -1,7 +1,7 @@
 from enum import Enum
 from datetime import datetime
 from typing import Optional, List, Any, Dict
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 class TaskStatus(int, Enum):
     PENDING = 0
@@ -27,9 +27,9 @@ class Task(BaseModel):
     title: str
     due_date: Optional[datetime] = None
     status: TaskStatus = TaskStatus.PENDING
-    category: Optional[int] = None  # カテゴリを数値で保持
+    category: Optional[TaskCategory] = None  # カテゴリ（未設定の場合は作成・更新時に自動分類）
     season_id: Optional[str] = None  # タスクが属するシーズンID
-    created_at: datetime = datetime.now()
+    created_at: datetime = Field(default_factory=datetime.now)
     completed_at: Optional[datetime] = None
     experienced_at: Optional[datetime] = None
 
@@ -41,9 +41,9 @@ class Story(BaseModel):
     content: str
     insight: str
     phase: StoryPhase
-    created_at: datetime = datetime.now()
+    created_at: datetime = Field(default_factory=datetime.now)
     summary: Optional[str] = None
-    completed_tasks: List[Dict[str, str]] = []  # List of {"original": str, "converted": str}
+    completed_tasks: List[Dict[str, str]] = Field(default_factory=list)  # List of {"original": str, "converted": str}
 
 class Season(BaseModel):
     id: Optional[str] = None
@@ -52,7 +52,7 @@ class Season(BaseModel):
     current_chapter: int = 0
     current_phase: StoryPhase = StoryPhase.KI
     previous_summary: str = ""
-    created_at: Any = datetime.now()
+    created_at: Any = Field(default_factory=datetime.now)
     updated_at: Optional[datetime] = None
     required_exp: int
     story_image_filename: Optional[str] = None
@@ -60,15 +60,17 @@ class Season(BaseModel):
 class User(BaseModel):
     id: Optional[str] = None
     player_name: Optional[str] = None
-    created_at: Any = datetime.now()
+    created_at: Any = Field(default_factory=datetime.now)
     current_season_id: Optional[str] = None
-    season_ids: List[str] = []
+    season_ids: List[str] = Field(default_factory=list)
 
 class ErrorMessages:
     USER_NOT_FOUND = "User not found"
     TASK_NOT_FOUND = "Task not found"
     SEASON_NOT_FOUND = "Season not found"
+    STORY_NOT_FOUND = "Story not found"
     TASK_ALREADY_COMPLETED = "Task already completed"
     NO_VALID_TASKS = "No valid tasks found"
-    USER_CREATION_FAILED = "Failed to create user" 
+    USER_CREATION_FAILED = "Failed to create user"
+    USER_ALREADY_EXISTS = "User already exists"
     UNAUTHORIZED = "Unauthorized access" 
\ No newline at end of file
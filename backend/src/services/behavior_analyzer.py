@@ -1,44 +1,22 @@
 import logging
-import json
 import os
-from typing import Dict, List, Optional, Any
-from dotenv import load_dotenv
-import vertexai
-from vertexai.preview.generative_models import GenerativeModel, GenerationConfig
+import hashlib
+import orjson
+from typing import Dict, List, Optional, Tuple, Any
+from vertexai.preview.generative_models import GenerationConfig
+from src.utils.vertex_client import generate_content, get_generative_model
 from src.models.types import TaskCategory
-from datetime import datetime, timezone, timedelta
+from src.utils.cache import TTLCache
+from datetime import date, datetime, timezone, timedelta
 
 logger = logging.getLogger(__name__)
 
-class BehaviorAnalyzer:
-    """
-    ユーザーの行動パターンを分析するサービス
-    
-    このクラスは、Vertex AIのGeminiモデルを使用して完了したタスクの一覧から
-    ユーザーの行動傾向や価値観を分析し、ポジティブな洞察とキーワードを生成します。
-    
-    Attributes:
-        model: Vertex AIのGenerativeModelインスタンス
-        analysis_prompt: 行動分析用のプロンプトテンプレート
-    """
+# 日本時間（UTC+9）
+_JST = timezone(timedelta(hours=9))
+_ONE_DAY = timedelta(days=1)
 
-    def __init__(self):
-        """
-        BehaviorAnalyzerの初期化
-        
-        環境変数を読み込み、Vertex AIを初期化し、
-        行動分析用のプロンプトを設定します。
-        
-        Raises:
-            ValueError: 必要な環境変数が設定されていない場合
-            Exception: Vertex AI初期化に失敗した場合
-        """
-        # 環境変数の読み込み
-        load_dotenv()
-        self._initialize_vertex_ai()
-        
-        # 行動分析用のプロンプト
-        self.analysis_prompt = """
+# 行動分析用のプロンプト（完了タスクの見出しまで）
+_ANALYSIS_PROMPT_HEAD = """
 あなたは異世界ファンタジーの賢者として、ユーザーの行動を静かに見守り、導くAIです。  
 以下のタスク履歴から、ユーザーの行動傾向を洞察し、次の行動の提案も含めて次の形式で出力してください。
 
@@ -47,13 +25,13 @@ class BehaviorAnalyzer:
 次のJSON構造に正確に従ってください。
 
 ```json
-{{
+{
   "title": "語り手の称号（最大10文字、日本語）",
   "name": "語り手の名前（最大8文字、日本語）",
   "insight": "150文字以内の前向きな洞察文（2文、賢者風）",
   "keywords": ["キーワード1", "キーワード2", "キーワード3"],
   "suggest": "150文字以内の次の行動の提案（1文のみ、句点は1つ、賢者風）"
-}}
+}
 ```
 
 ## 【文体・出力ルール】
@@ -75,49 +53,102 @@ class BehaviorAnalyzer:
 
 ## 【分析方針】
 
-- 完了したタスクから行動傾向を分析し、未完了タスクの期限や内容を考慮して次の行動を提案してください
+- 完了したタスクから行動傾向を分析し、提案対象タスクの内容と提案理由を考慮して次の行動を提案してください
 - ユーザーの成長や継続性を促すような提案を心がけてください
 - suggestフィールドには、次の行動を賢者風の文体で、断定や命令を避けて控えめに提案してください（1文のみ、句点は1つ）
 - **行動の意図や性質（例：節目の行動、習慣の継続、準備行為など）を抽象的に表現してください**
 - ファンタジーの世界観にふさわしい表現になるようにしてください
 
-## 【優先順位と提案方針】
+## 【提案方針】
 
-**重要：以下の順序で厳格に判定し、最も優先度の高い1つのタスクのみを提案してください**
+- suggestフィールドでは、「提案対象タスク」に記載された1つのタスクのみを念頭に提案してください
+- 提案理由（期限超過／期限間近／放置）を提案の語調に反映してください
+- 提案対象タスクが「なし」の場合は、完了タスクの傾向から次の行動を控えめに提案してください
 
-1. **期限の過ぎたタスク（最優先）**
-   - due_dateが現在日時（{current_datetime}）より過去のタスクは、必ず提案に含めてください
-   - 期限超過のタスクがある場合は、他のタスクよりも優先して提案してください
-   - 複数の期限超過タスクがある場合は、最も期限が古いタスク（最も長く放置されているタスク）を一つ選択してください
-   - 日付の比較は、YYYY-MM-DD形式で文字列比較を行ってください（例：2025-06-25 < 2025-06-26）
+---
 
-2. **期限が近いタスク（中優先）**
-   - due_dateが現在日（{current_datetime}）または次の日のタスクは「期限が近い」として扱ってください
-   - 期限が近いタスクがある場合は、放置タスクよりも必ず優先して提案してください
-   - 複数の期限が近いタスクがある場合は、最も期限が近いタスク（最も緊急性の高いタスク）を一つ選択してください
+## 【完了タスク】
+"""
+# 完了タスクと提案対象タスクの間の見出し
+_SUGGESTED_TASK_HEADER = "\n\n## 【提案対象タスク】\n"
 
-3. **放置タスク（低優先）**
-   - created_atから2週間以上経過したタスクのみを提案してください
-   - 期限が近いタスクがない場合のみ、放置タスクを提案してください
-   - 複数の放置タスクがある場合は、最も古いタスク（最も長く放置されているタスク）を一つ選択してください
+# 放置タスクとみなす作成からの経過日数
+STALE_TASK_DAYS = 14
 
-### **絶対的な優先順位ルール**
+# 出力するJSONのスキーマ（モデルの出力をこの形式に制約する）
+_RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "title": {"type": "string"},
+        "name": {"type": "string"},
+        "insight": {"type": "string"},
+        "keywords": {"type": "array", "items": {"type": "string"}},
+        "suggest": {"type": "string"}
+    },
+    "required": ["title", "name", "insight", "keywords", "suggest"]
+}
 
-- 期限超過タスク > 期限が近いタスク > 放置タスク  
-- 上位の優先度のタスクがある場合は、下位の優先度のタスクは絶対に提案しないでください
+# 生成設定
+_GENERATION_CONFIG = GenerationConfig(
+    temperature=0.3,  # 創造性と一貫性のバランス
+    max_output_tokens=256,  # JSON出力に十分な長さ
+    top_p=0.9,
+    top_k=40,
+    response_mime_type="application/json",
+    response_schema=_RESPONSE_SCHEMA
+)
 
----
+# カテゴリ数値 -> 表示名（TaskCategoryの値で直接添字アクセスする）
+_CATEGORY_NAMES = {
+    TaskCategory.WORK: "仕事",
+    TaskCategory.HEALTH: "健康",
+    TaskCategory.LEARNING: "学習",
+    TaskCategory.LIFE: "生活",
+    TaskCategory.HOBBY: "趣味",
+    TaskCategory.OTHER: "その他"
+}
+_CATEGORY_LABELS = tuple(
+    _CATEGORY_NAMES.get(value, "その他") for value in range(max(_CATEGORY_NAMES) + 1)
+)
 
-## 【現在日時】
+def _category_label(category_value: Any) -> str:
+    """カテゴリ数値を表示名に変換（未設定・範囲外は「その他」）"""
+    if isinstance(category_value, int) and 0 <= category_value < len(_CATEGORY_LABELS):
+        return _CATEGORY_LABELS[category_value]
+    return "その他"
 
-{current_datetime}
+# 行動分析結果のキャッシュ（プロンプトのハッシュ -> 分析結果）
+BEHAVIOR_CACHE_TTL = 3600
+_behavior_cache = TTLCache()
 
-## 【完了タスク】
-{completed_tasks}
+def _date_str(value: Any) -> str:
+    """日付（YYYY-MM-DD形式の文字列またはdatetime）を比較用のYYYY-MM-DD文字列に変換"""
+    return value[:10] if isinstance(value, str) else value.strftime("%Y-%m-%d")
 
-## 【未完了タスク】
-{incomplete_tasks}
-"""
+class BehaviorAnalyzer:
+    """
+    ユーザーの行動パターンを分析するサービス
+    
+    このクラスは、Vertex AIのGeminiモデルを使用して完了したタスクの一覧から
+    ユーザーの行動傾向や価値観を分析し、ポジティブな洞察とキーワードを生成します。
+    
+    Attributes:
+        model: Vertex AIのGenerativeModelインスタンス
+        stats: 分析の要求数と、実際にVertex AIを呼び出した回数
+    """
+
+    def __init__(self):
+        """
+        BehaviorAnalyzerの初期化
+        
+        Vertex AIを初期化します。環境変数はアプリケーション起動時に読み込み済みの前提です。
+        
+        Raises:
+            ValueError: 必要な環境変数が設定されていない場合
+            Exception: Vertex AI初期化に失敗した場合
+        """
+        self._initialize_vertex_ai()
+        self.stats = {"requests": 0, "model_calls": 0}
 
     def _initialize_vertex_ai(self):
         """
@@ -141,17 +172,11 @@ class BehaviorAnalyzer:
             location = os.getenv("VERTEX_AI_LOCATION")
             model_name = os.getenv("VERTEX_AI_MODEL_NAME")
             
-            # Vertex AIの初期化
-            vertexai.init(
-                project=project_id,
-                location=location
-            )
-            
-            # モデルの初期化
-            self.model = GenerativeModel(model_name)
+            # Vertex AIの初期化とモデルの取得（プロセス内で共有）
+            self.model = get_generative_model(project_id, location, model_name)
             
         except Exception as e:
-            logger.error(f"BehaviorAnalyzer - Vertex AI初期化エラー: {str(e)}")
+            logger.error("BehaviorAnalyzer - Vertex AI初期化エラー: %s", e)
             raise
 
     async def analyze_behavior(self, completed_tasks: List[Dict[str, Any]], incomplete_tasks: List[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
@@ -195,61 +220,43 @@ class BehaviorAnalyzer:
             - AIからの応答がJSON形式でない場合はNoneを返す
             - エラーが発生した場合もNoneを返す
         """
-        logger.info(f"行動分析開始: {len(completed_tasks)}件の完了タスク, {len(incomplete_tasks) if incomplete_tasks else 0}件の未完了タスク")
+        logger.info("行動分析開始: %d件の完了タスク, %d件の未完了タスク", len(completed_tasks), len(incomplete_tasks) if incomplete_tasks else 0)
         
         try:
             # タスクが10件を超える場合は最新の10件のみを使用
             if len(completed_tasks) > 10:
                 completed_tasks = completed_tasks[-10:]
-                logger.info(f"完了タスクを10件に制限")
+                logger.info("完了タスクを10件に制限")
             
             if incomplete_tasks and len(incomplete_tasks) > 10:
                 incomplete_tasks = incomplete_tasks[:10]
-                logger.info(f"未完了タスクを10件に制限")
-            
-            # タスクデータをプロンプト用の形式に変換
-            task_data = self._format_tasks_for_analysis(completed_tasks, incomplete_tasks)
+                logger.info("未完了タスクを10件に制限")
             
-            # 現在日時を取得（日本時間）
-            jst = timezone(timedelta(hours=9))
-            current_datetime_jst = datetime.now(jst)
-            # 世界時間（UTC）に変換
-            current_datetime_utc = current_datetime_jst.astimezone(timezone.utc).strftime("%Y-%m-%d")
+            # 提案対象のタスクを優先順位に従って1件だけ選ぶ（日付は日本時間で判定）
+            suggested_task, reason = self._pick_suggested_task(incomplete_tasks or [], datetime.now(_JST).date())
             
-            # 生成設定
-            generation_config = GenerationConfig(
-                temperature=0.3,  # 創造性と一貫性のバランス
-                max_output_tokens=256,  # JSON出力に十分な長さ
-                top_p=0.9,
-                top_k=40
-            )
+            # タスクデータをプロンプト用の形式に変換
+            task_data = self._format_tasks_for_analysis(completed_tasks, [suggested_task] if suggested_task else [])
             
             # プロンプトにタスクデータを埋め込み
-            prompt = self.analysis_prompt.format(
-                completed_tasks=task_data[0], 
-                incomplete_tasks=task_data[1],
-                current_datetime=current_datetime_utc
+            prompt = (
+                _ANALYSIS_PROMPT_HEAD
+                + task_data[0]
+                + _SUGGESTED_TASK_HEADER
+                + (f"提案理由: {reason}\n" + task_data[1] if suggested_task else "なし")
+                + "\n"
             )
-            print(prompt)
-            # Vertex AIを使用して行動分析を実行
-            response = await self.model.generate_content_async(
-                prompt,
-                generation_config=generation_config
-            )
-            
-            # レスポンスからJSONを抽出
-            response_text = response.text.strip()
-            
-            # Markdownのコードブロックを除去
-            if response_text.startswith('```json'):
-                response_text = response_text[7:]
-            if response_text.endswith('```'):
-                response_text = response_text[:-3]
-            response_text = response_text.strip()
-            
-            # JSONパース
+            logger.debug("行動分析プロンプト: %s", prompt)
+            # 同じプロンプト（日付・タスク内容が同一）の分析結果はキャッシュを再利用
+            # 同時に同じ分析が要求された場合も、Vertex AIの呼び出しは1回にまとめられる
+            prompt_hash = hashlib.blake2b(prompt.encode(), digest_size=16).hexdigest()
+            self.stats["requests"] += 1
             try:
-                result = json.loads(response_text)
+                result = await _behavior_cache.get_or_fetch(
+                    f"behavior:{prompt_hash}",
+                    BEHAVIOR_CACHE_TTL,
+                    lambda: self._call_model(prompt)
+                )
                 title = result.get("title", "")
                 name = result.get("name", "")
                 insight = result.get("insight", "")
@@ -268,39 +275,85 @@ class BehaviorAnalyzer:
                     "suggest": suggest
                 }
                     
-            except json.JSONDecodeError as e:
-                logger.error(f"JSONパースエラー: {str(e)}, レスポンス: {repr(response_text)}")
+            except orjson.JSONDecodeError:
                 return None
 
         except Exception as e:
-            logger.error(f"行動分析エラー: {str(e)}")
+            logger.error("行動分析エラー: %s", e)
             return None
 
-    def _convert_date_to_utc(self, date_str: str) -> str:
+    def _pick_suggested_task(self, incomplete_tasks: List[Dict[str, Any]], today: date) -> Tuple[Optional[Dict[str, Any]], str]:
+        """
+        未完了タスクから提案対象のタスクを1件選ぶ
+        
+        以下の優先順位で判定し、最も優先度の高いタスクを返します。
+        1. 期限超過（期限日が今日より前）: 最も期限の古いタスク
+        2. 期限間近（期限日が今日または明日）: 最も期限の近いタスク
+        3. 放置（作成からSTALE_TASK_DAYS日以上経過）: 最も古いタスク
+        
+        Args:
+            incomplete_tasks (List[Dict[str, Any]]): 未完了タスクの一覧
+            today (date): 判定の基準日（日本時間）
+            
+        Returns:
+            Tuple[Optional[Dict[str, Any]], str]: (提案対象のタスク, 提案理由)
+                                                  該当するタスクがない場合は (None, "")
+        """
+        today_str = today.isoformat()
+        tomorrow_str = (today + _ONE_DAY).isoformat()
+        stale_str = (today - timedelta(days=STALE_TASK_DAYS)).isoformat()
+        
+        with_due = [(_date_str(task['due_date']), task) for task in incomplete_tasks if task.get('due_date')]
+        overdue = [entry for entry in with_due if entry[0] < today_str]
+        if overdue:
+            return min(overdue, key=lambda entry: entry[0])[1], "期限超過"
+        
+        due_soon = [entry for entry in with_due if entry[0] <= tomorrow_str]
+        if due_soon:
+            return min(due_soon, key=lambda entry: entry[0])[1], "期限間近"
+        
+        stale = [
+            (created_at, task)
+            for created_at, task in (
+                (_date_str(task['created_at']), task) for task in incomplete_tasks if task.get('created_at')
+            )
+            if created_at <= stale_str
+        ]
+        if stale:
+            return min(stale, key=lambda entry: entry[0])[1], "放置"
+        
+        return None, ""
+
+    async def _call_model(self, prompt: str) -> Dict[str, Any]:
         """
-        日付文字列を日本時間として解釈し、世界時間（UTC）に変換する
+        Vertex AIで行動分析を実行し、応答のJSONを辞書として返す
         
         Args:
-            date_str (str): YYYY-MM-DD形式の日付文字列
+            prompt (str): 行動分析用のプロンプト
             
         Returns:
-            str: UTCに変換されたYYYY-MM-DD形式の日付文字列
+            Dict[str, Any]: モデルが出力したJSON
+            
+        Raises:
+            orjson.JSONDecodeError: 応答がJSON形式でない場合
         """
+        # Vertex AIを使用して行動分析を実行
+        self.stats["model_calls"] += 1
+        response = await generate_content(
+            self.model,
+            prompt,
+            generation_config=_GENERATION_CONFIG
+        )
+        
+        # JSONモードで生成しているため、コードブロックは含まれない
+        response_text = response.text
+        
+        # JSONパース
         try:
-            if isinstance(date_str, str):
-                # YYYY-MM-DD形式の文字列を想定
-                date_dt = datetime.strptime(date_str, "%Y-%m-%d")
-                # 日本時間として解釈してUTCに変換
-                jst = timezone(timedelta(hours=9))
-                date_jst = date_dt.replace(tzinfo=jst)
-                date_utc = date_jst.astimezone(timezone.utc)
-                return date_utc.strftime("%Y-%m-%d")
-            else:
-                # 既にdatetimeオブジェクトの場合
-                return date_str.strftime("%Y-%m-%d")
-        except Exception as e:
-            logger.warning(f"日付変換エラー: {e}, 元の値: {date_str}")
-            return date_str
+            return orjson.loads(response_text)
+        except orjson.JSONDecodeError as e:
+            logger.error("JSONパースエラー: %s, レスポンス: %r", e, response_text)
+            raise
 
     def _format_tasks_for_analysis(self, completed_tasks: List[Dict[str, Any]], incomplete_tasks: List[Dict[str, Any]] = None) -> List[str]:
         """
@@ -341,55 +394,23 @@ class BehaviorAnalyzer:
             ... ]
             >>> formatted = analyzer._format_tasks_for_analysis(tasks)
             >>> print(formatted)
-            # ["[{\"task\": \"商談資料\", \"category\": \"仕事\"}]", "[]"]
+            # ["[{\"task\":\"商談資料\",\"category\":\"仕事\"}]", "[]"]
         """
-        category_map = {
-            TaskCategory.WORK: "仕事",
-            TaskCategory.HEALTH: "健康",
-            TaskCategory.LEARNING: "学習",
-            TaskCategory.LIFE: "生活",
-            TaskCategory.HOBBY: "趣味",
-            TaskCategory.OTHER: "その他"
-        }
-        
-        formatted_completed_tasks = []
-        formatted_incomplete_tasks = []
-        
-        # 完了タスクの処理
-        for task in completed_tasks:
-            # Taskモデルから必要項目のみを抽出
-            title = task.get('title', '')
-            category_value = task.get('category')
-            category_text = category_map.get(category_value, 'その他')
-            
-            # 完了日時がある場合のみ分析対象とする
-            if task.get('completed_at'):
-                formatted_completed_tasks.append({
-                    'task': title,
-                    'category': category_text
-                })
+        # 完了タスクの処理（完了日時があるものだけを、必要項目のみ抽出して1回で組み立てる）
+        formatted_completed_tasks = [
+            {'task': task.get('title', ''), 'category': _category_label(task.get('category'))}
+            for task in completed_tasks
+            if task.get('completed_at')
+        ]
         
-        # 未完了タスクの処理
-        if incomplete_tasks:
-            for task in incomplete_tasks:
-                title = task.get('title', '')
-                category_value = task.get('category')
-                category_text = category_map.get(category_value, 'その他')
-                due_date = task.get('due_date')
-                created_at = task.get('created_at')
-                
-                # 日付を世界時間（UTC）に変換
-                due_date_str = self._convert_date_to_utc(due_date) if due_date else None
-                created_at_str = self._convert_date_to_utc(created_at) if created_at else None
-                
-                formatted_incomplete_tasks.append({
-                    'task': title,
-                    'category': category_text,
-                    'due_date': due_date_str,
-                    'created_at': created_at_str
-                })
+        # 未完了タスクの処理（期限の判定は提案対象の選択時に済んでいるため日付は含めない）
+        formatted_incomplete_tasks = [
+            {'task': task.get('title', ''), 'category': _category_label(task.get('category'))}
+            for task in incomplete_tasks or []
+        ]
         
         return [
-            json.dumps(formatted_completed_tasks, ensure_ascii=False, indent=2),
-            json.dumps(formatted_incomplete_tasks, ensure_ascii=False, indent=2)
+            # インデントなしで出力し、プロンプトのトークン数を抑える
+            orjson.dumps(formatted_completed_tasks).decode(),
+            orjson.dumps(formatted_incomplete_tasks).decode()
         ]
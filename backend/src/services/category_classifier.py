@@ -1,14 +1,46 @@
+import asyncio
+import hashlib
 import logging
-import json
+import orjson
 import os
-from typing import Dict, Optional
-from dotenv import load_dotenv
-import vertexai
-from vertexai.preview.generative_models import GenerativeModel, GenerationConfig
+from typing import Dict, List, Optional, Tuple
+from vertexai.preview.generative_models import GenerationConfig
+from src.utils.vertex_client import generate_content, get_generative_model
+from src.utils.cache import TTLCache
+from src.services.embedding_classifier import EmbeddingClassifier
 from src.models.types import TaskCategory
 
 logger = logging.getLogger(__name__)
 
+# 分類結果のキャッシュ有効期間（秒）
+CLASSIFICATION_CACHE_TTL = 86400
+# (モデル名, 正規化したタイトル) のハッシュ -> カテゴリの数値
+_classification_cache = TTLCache(max_entries=4096)
+# 1回のリクエストでまとめて分類するタイトル数の上限
+CLASSIFICATION_BATCH_SIZE = 16
+
+# 出力するJSONのスキーマ（カテゴリ名を列挙値に制約する）
+_CATEGORY_NAME_SCHEMA = {"type": "string", "enum": ["仕事", "健康", "学習", "生活", "趣味", "その他"]}
+_CLASSIFICATION_SCHEMA = {
+    "type": "object",
+    "properties": {"category": _CATEGORY_NAME_SCHEMA},
+    "required": ["category"]
+}
+_BATCH_CLASSIFICATION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "results": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"i": {"type": "integer"}, "category": _CATEGORY_NAME_SCHEMA},
+                "required": ["i", "category"]
+            }
+        }
+    },
+    "required": ["results"]
+}
+
 class CategoryClassifier:
     """
     タスクのカテゴリを自動分類するサービス
@@ -26,23 +58,30 @@ class CategoryClassifier:
     
     Attributes:
         model: Vertex AIのGenerativeModelインスタンス
+        model_name: 使用するモデル名
         classification_prompt: カテゴリ分類用のプロンプトテンプレート
+        batch_classification_prompt: 複数タスクの一括分類用のプロンプトテンプレート
+        embedding_classifier: 埋め込みの類似度による軽量な分類器
+        stats: 分類結果キャッシュのヒット数・ミス数、埋め込みで分類できた件数、
+               分類中の同じタイトルの結果を共有した件数
     """
 
     def __init__(self):
         """
         CategoryClassifierの初期化
         
-        環境変数を読み込み、Vertex AIを初期化し、
-        カテゴリ分類用のプロンプトを設定します。
+        Vertex AIを初期化し、カテゴリ分類用のプロンプトを設定します。
+        環境変数はアプリケーション起動時に読み込み済みの前提です。
         
         Raises:
             ValueError: 必要な環境変数が設定されていない場合
             Exception: Vertex AI初期化に失敗した場合
         """
-        # 環境変数の読み込み
-        load_dotenv()
         self._initialize_vertex_ai()
+        self.embedding_classifier = EmbeddingClassifier()
+        self.stats = {"hits": 0, "misses": 0, "embedding": 0, "coalesced": 0}
+        # キャッシュキー -> 分類中の結果を待ち受けるFuture
+        self._inflight: Dict[str, asyncio.Future] = {}
         
         # カテゴリ分類用のプロンプト
         self.classification_prompt = """
@@ -64,6 +103,39 @@ class CategoryClassifier:
 タスク内容: {task_title}
 """
 
+        # 複数タスクの一括分類用のプロンプト
+        self.batch_classification_prompt = """
+あなたは短いタスク内容を読み取り、6つのカテゴリのうちもっとも適切な1つに分類する分類アシスタントです。
+
+以下の番号付きのタスクそれぞれについて、もっとも適切なカテゴリを1つだけ選び、
+次のJSON形式で出力してください：
+
+{{
+"results": [
+{{"i": 1, "category": "◯◯"}},
+{{"i": 2, "category": "◯◯"}}
+]
+}}
+
+カテゴリは以下から選んでください：
+仕事 / 健康 / 学習 / 生活 / 趣味 / その他
+
+補足説明や他の出力は一切不要です。
+すべてのタスクについて、番号 i を付けて出力してください。
+判断が難しい場合は "その他" を選んでください。
+
+タスク内容:
+{task_titles}
+"""
+
+        # タイトルの前後のテンプレート部分を事前に展開しておき、呼び出しごとのformatを省く
+        self._classification_prompt_parts = self.classification_prompt.format(
+            task_title="{task_title}"
+        ).split("{task_title}")
+        self._batch_classification_prompt_parts = self.batch_classification_prompt.format(
+            task_titles="{task_titles}"
+        ).split("{task_titles}")
+
     def _initialize_vertex_ai(self):
         """
         Vertex AIの初期化
@@ -86,14 +158,9 @@ class CategoryClassifier:
             location = os.getenv("VERTEX_AI_LOCATION")
             model_name = os.getenv("VERTEX_AI_MODEL_NAME")
             
-            # Vertex AIの初期化
-            vertexai.init(
-                project=project_id,
-                location=location
-            )
-            
-            # モデルの初期化
-            self.model = GenerativeModel(model_name)
+            # Vertex AIの初期化とモデルの取得（プロセス内で共有）
+            self.model_name = model_name
+            self.model = get_generative_model(project_id, location, model_name)
             
         except Exception as e:
             logger.error(f"Vertex AI初期化エラー: {str(e)}")
@@ -122,60 +189,244 @@ class CategoryClassifier:
             - AIからの応答がJSON形式でない場合はTaskCategory.OTHERを返す
             - 無効なカテゴリが返された場合もTaskCategory.OTHERを返す
             - エラーが発生した場合もTaskCategory.OTHERを返す
+            - 同じタイトル（前後の空白・大文字小文字を無視）の分類結果はキャッシュから返す
         """
-        logger.info(f"カテゴリ分類開始: {task_title}")
-        try:
-            # 生成設定
-            generation_config = GenerationConfig(
-                temperature=0.1,  # 一貫性を重視
-                max_output_tokens=128,  # JSON出力に十分な長さ
-                top_p=0.9,
-                top_k=40
-            )
+        return (await self.classify_task_categories([task_title]))[0]
+
+    async def classify_task_categories(self, task_titles: List[str]) -> List[int]:
+        """
+        複数のタスクタイトルをまとめてカテゴリ分類する
+        
+        キャッシュにないタイトルはまず埋め込みの類似度で分類し、確信度が
+        低かったものだけを最大CLASSIFICATION_BATCH_SIZE件ずつ1つの
+        プロンプトにまとめ、各グループを並行してGeminiに問い合わせます。
+        
+        Args:
+            task_titles (List[str]): 分類対象のタスクタイトルのリスト
             
-            # プロンプトにタスクタイトルを埋め込み
-            prompt = self.classification_prompt.format(task_title=task_title)
-            logger.debug(f"生成されたプロンプト: {prompt}")
+        Returns:
+            List[int]: 入力と同じ順序のカテゴリの数値のリスト
+                       分類に失敗したタイトルはTaskCategory.OTHER
+        """
+        logger.info(f"カテゴリ分類開始: {len(task_titles)}件")
+        results: List[int] = [TaskCategory.OTHER] * len(task_titles)
+        pending: List[Tuple[int, str, str]] = []
+        for i, task_title in enumerate(task_titles):
+            cache_key = self._cache_key(task_title)
+            cached = _classification_cache.get(cache_key)
+            if cached is not None:
+                self.stats["hits"] += 1
+                logger.debug(f"カテゴリ分類キャッシュヒット: {task_title}")
+                results[i] = cached
+            else:
+                self.stats["misses"] += 1
+                pending.append((i, task_title, cache_key))
+
+        if not pending:
+            return results
+
+        # 同じタイトルを分類中のリクエストがあれば、その結果を待ち受ける
+        loop = asyncio.get_running_loop()
+        owned: List[Tuple[int, str, str]] = []
+        waiting: List[Tuple[int, asyncio.Future]] = []
+        for entry in pending:
+            future = self._inflight.get(entry[2])
+            if future is None:
+                self._inflight[entry[2]] = loop.create_future()
+                owned.append(entry)
+            else:
+                self.stats["coalesced"] += 1
+                waiting.append((entry[0], future))
+
+        try:
+            if owned:
+                await self._classify_uncached(owned, results)
+        finally:
+            # 待ち受けているリクエストに結果を渡す（失敗時はTaskCategory.OTHER）
+            for i, _, cache_key in owned:
+                future = self._inflight.pop(cache_key, None)
+                if future is not None and not future.done():
+                    future.set_result(results[i])
+
+        if waiting:
+            values = await asyncio.gather(*(asyncio.shield(future) for _, future in waiting))
+            for (i, _), category_value in zip(waiting, values):
+                results[i] = category_value
+        return results
+
+    async def _classify_uncached(self, pending: List[Tuple[int, str, str]], results: List[int]) -> None:
+        """
+        キャッシュにないタイトルを分類し、結果をresultsに書き込む
+
+        Args:
+            pending (List[Tuple[int, str, str]]): (結果の位置, タスクタイトル, キャッシュキー) のリスト
+            results (List[int]): 分類結果を書き込むリスト
+        """
+        # 埋め込みの類似度で確信度高く分類できたタイトルはGeminiを呼び出さない
+        try:
+            embedded = await self.embedding_classifier.classify([title for _, title, _ in pending])
+        except Exception as e:
+            logger.warning(f"埋め込みによるカテゴリ分類エラー: {str(e)}")
+            embedded = [None] * len(pending)
+
+        remaining: List[Tuple[int, str, str]] = []
+        for entry, category_value in zip(pending, embedded):
+            if category_value is None:
+                remaining.append(entry)
+            else:
+                self.stats["embedding"] += 1
+                results[entry[0]] = self._store_result(entry[1], entry[2], category_value)
+
+        chunks = [
+            remaining[i:i + CLASSIFICATION_BATCH_SIZE]
+            for i in range(0, len(remaining), CLASSIFICATION_BATCH_SIZE)
+        ]
+        chunk_results = await asyncio.gather(
+            *(self._classify_chunk([title for _, title, _ in chunk]) for chunk in chunks)
+        )
+
+        for chunk, values in zip(chunks, chunk_results):
+            for (i, task_title, cache_key), category_value in zip(chunk, values):
+                if category_value is not None:
+                    results[i] = self._store_result(task_title, cache_key, category_value)
+
+    def _store_result(self, task_title: str, cache_key: str, category_value: int) -> int:
+        """
+        分類結果をキャッシュに保存する
+
+        Args:
+            task_title (str): 分類したタスクタイトル
+            cache_key (str): キャッシュキー
+            category_value (int): 分類されたカテゴリの数値
+
+        Returns:
+            int: 分類されたカテゴリの数値
+        """
+        logger.info(f"タスク '{task_title}' をカテゴリ '{category_value}' に分類しました")
+        # 正しく分類できた結果のみキャッシュする
+        _classification_cache.set(cache_key, category_value, CLASSIFICATION_CACHE_TTL)
+        return category_value
+
+    async def _classify_chunk(self, task_titles: List[str]) -> List[Optional[int]]:
+        """
+        1グループ分のタスクタイトルを1回のリクエストで分類する
+        
+        応答を解釈できなかったタイトルは1件ずつ分類し直します。
+        
+        Args:
+            task_titles (List[str]): 分類対象のタスクタイトルのリスト
             
-            # Vertex AIを使用してカテゴリを分類
-            response = await self.model.generate_content_async(
-                prompt,
-                generation_config=generation_config
+        Returns:
+            List[Optional[int]]: 入力と同じ順序のカテゴリの数値（分類できなかったものはNone）
+        """
+        if len(task_titles) == 1:
+            return [await self._classify_single(task_titles[0])]
+
+        values: List[Optional[int]] = [None] * len(task_titles)
+        try:
+            numbered_titles = "\n".join(f"{i}) {title}" for i, title in enumerate(task_titles, 1))
+            result = await self._generate_json(
+                numbered_titles.join(self._batch_classification_prompt_parts),
+                _BATCH_CLASSIFICATION_SCHEMA,
+                max_output_tokens=24 * len(task_titles) + 32
             )
+            for item in result.get("results", []):
+                index = item.get("i")
+                if isinstance(index, int) and 1 <= index <= len(task_titles):
+                    values[index - 1] = self._convert_category_to_value(item.get("category"))
+        except Exception as e:
+            logger.error(f"一括カテゴリ分類エラー: {str(e)}")
+
+        # 一括分類で結果が得られなかったタイトルを個別に再分類
+        retry = [i for i, value in enumerate(values) if value is None]
+        if retry:
+            retried = await asyncio.gather(*(self._classify_single(task_titles[i]) for i in retry))
+            for i, value in zip(retry, retried):
+                values[i] = value
+        return values
+
+    async def _classify_single(self, task_title: str) -> Optional[int]:
+        """
+        1件のタスクタイトルを分類する
+        
+        Args:
+            task_title (str): 分類対象のタスクタイトル
             
-            # レスポンスからJSONを抽出
-            response_text = response.text.strip()
-            logger.debug(f"カテゴリ分類レスポンス: {response_text}")
-            
-            # Markdownのコードブロックを除去
-            if response_text.startswith('```json'):
-                response_text = response_text[7:]
-            if response_text.endswith('```'):
-                response_text = response_text[:-3]
-            response_text = response_text.strip()
+        Returns:
+            Optional[int]: 分類されたカテゴリの数値、分類できなかった場合はNone
+        """
+        try:
+            result = await self._generate_json(
+                task_title.join(self._classification_prompt_parts),
+                _CLASSIFICATION_SCHEMA,
+                max_output_tokens=24  # JSONオブジェクト1つ分の長さ
+            )
+            category_text = result.get("category")
+            logger.debug(f"パースされたカテゴリ: {category_text}")
             
-            # JSONパース
-            try:
-                result = json.loads(response_text)
-                category_text = result.get("category")
-                logger.debug(f"パースされたカテゴリ: {category_text}")
+            # 文字列から数値に変換
+            category_value = self._convert_category_to_value(category_text)
+            if category_value is None:
+                logger.warning(f"無効なカテゴリが返されました: {category_text}")
+            return category_value
                 
-                # 文字列から数値に変換
-                category_value = self._convert_category_to_value(category_text)
-                if category_value is not None:
-                    logger.info(f"タスク '{task_title}' をカテゴリ '{category_value}' ({category_text}) に分類しました")
-                    return category_value
-                else:
-                    logger.warning(f"無効なカテゴリが返されました: {category_text}")
-                    return TaskCategory.OTHER
-                    
-            except json.JSONDecodeError as e:
-                logger.error(f"JSONパースエラー: {str(e)}, レスポンス: {response_text}")
-                return TaskCategory.OTHER
-
+        except orjson.JSONDecodeError as e:
+            logger.error(f"JSONパースエラー: {str(e)}")
+            return None
         except Exception as e:
             logger.error(f"カテゴリ分類エラー: {str(e)}")
-            return TaskCategory.OTHER
+            return None
+
+    async def _generate_json(self, prompt: str, response_schema: dict, max_output_tokens: int) -> dict:
+        """
+        プロンプトをGeminiに送信し、応答をJSONとして解釈する
+        
+        Args:
+            prompt (str): 送信するプロンプト
+            response_schema (dict): 出力するJSONのスキーマ
+            max_output_tokens (int): 最大出力トークン数
+            
+        Returns:
+            dict: パースされたJSON
+            
+        Raises:
+            orjson.JSONDecodeError: 応答がJSON形式でない場合
+        """
+        # 生成設定
+        generation_config = GenerationConfig(
+            temperature=0.1,  # 一貫性を重視
+            max_output_tokens=max_output_tokens,
+            top_p=0.9,
+            top_k=40,
+            response_mime_type="application/json",
+            response_schema=response_schema
+        )
+        logger.debug(f"生成されたプロンプト: {prompt}")
+        
+        # Vertex AIを使用してカテゴリを分類
+        response = await generate_content(
+            self.model,
+            prompt,
+            generation_config=generation_config
+        )
+        
+        # JSONモードで生成しているため、コードブロックは含まれない
+        response_text = response.text
+        logger.debug(f"カテゴリ分類レスポンス: {response_text}")
+        return orjson.loads(response_text)
+
+    def _cache_key(self, task_title: str) -> str:
+        """
+        分類結果キャッシュのキーを生成する
+
+        Args:
+            task_title (str): 分類対象のタスクタイトル
+
+        Returns:
+            str: モデル名と正規化したタイトルから求めたSHA-256ハッシュ
+        """
+        payload = orjson.dumps({"m": self.model_name, "t": task_title.strip().lower()})
+        return hashlib.sha256(payload).hexdigest()
 
     def _convert_category_to_value(self, category_text: str) -> Optional[int]:
         """
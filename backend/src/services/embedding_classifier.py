@@ -0,0 +1,133 @@
+import asyncio
+import logging
+import math
+import os
+from typing import Dict, List, Optional, Tuple
+from vertexai.language_models import TextEmbeddingModel
+from src.models.types import TaskCategory
+
+logger = logging.getLogger(__name__)
+
+# 使用する埋め込みモデル（日本語に対応した多言語モデル）
+DEFAULT_EMBEDDING_MODEL_NAME = "text-multilingual-embedding-002"
+
+# 各カテゴリの代表的なタスク例（重心ベクトルの算出に使用）
+_CATEGORY_SEEDS: Dict[int, List[str]] = {
+    TaskCategory.WORK: ["会議の資料を準備する", "取引先にメールを返信する", "企画書を作成する", "経費精算をする", "商談の準備"],
+    TaskCategory.HEALTH: ["ジョギングする", "筋トレをする", "ストレッチをする", "早く寝る", "病院に行く"],
+    TaskCategory.LEARNING: ["英単語を覚える", "本を読む", "資格試験の勉強をする", "プログラミングを学ぶ", "オンライン講座を受ける"],
+    TaskCategory.LIFE: ["部屋を掃除する", "洗濯をする", "食材を買いに行く", "ゴミを出す", "料理を作る"],
+    TaskCategory.HOBBY: ["ゲームをする", "絵を描く", "ギターを練習する", "映画を観る", "写真を撮りに行く"],
+    TaskCategory.OTHER: ["あれをやる", "確認", "メモ", "なんとなく", "その他の用事"],
+}
+
+def _normalize(vector: List[float]) -> List[float]:
+    """ベクトルをL2正規化する"""
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+class EmbeddingClassifier:
+    """
+    埋め込みベクトルの類似度によってタスクのカテゴリを分類するサービス
+
+    タスクタイトルの埋め込みと、カテゴリごとの代表例から求めた重心ベクトルの
+    コサイン類似度を比較します。生成モデルを呼び出すよりも軽量なため、
+    確信度の高いタイトルはこちらで分類し、判断が難しいものだけを
+    Geminiによる分類に回すために使用します。
+
+    Attributes:
+        model_name: 使用する埋め込みモデル名
+        min_score: 分類結果として採用する最小の類似度
+        min_margin: 1位と2位の類似度の差の最小値
+    """
+
+    def __init__(self):
+        """
+        EmbeddingClassifierの初期化
+
+        モデルの取得と重心ベクトルの算出は最初の分類時に行います。
+
+        Environment Variables:
+            VERTEX_AI_EMBEDDING_MODEL_NAME: 埋め込みモデル名
+            CATEGORY_EMBEDDING_MIN_SCORE: 採用する最小の類似度
+            CATEGORY_EMBEDDING_MIN_MARGIN: 1位と2位の類似度の差の最小値
+        """
+        self.model_name = os.getenv("VERTEX_AI_EMBEDDING_MODEL_NAME", DEFAULT_EMBEDDING_MODEL_NAME)
+        self.min_score = float(os.getenv("CATEGORY_EMBEDDING_MIN_SCORE", "0.55"))
+        self.min_margin = float(os.getenv("CATEGORY_EMBEDDING_MIN_MARGIN", "0.03"))
+        self._model: Optional[TextEmbeddingModel] = None
+        # (カテゴリの数値, 正規化済みの重心ベクトル) のリスト
+        self._centroids: Optional[List[Tuple[int, List[float]]]] = None
+        self._lock = asyncio.Lock()
+
+    async def classify(self, task_titles: List[str]) -> List[Optional[int]]:
+        """
+        タスクタイトルを埋め込みの類似度で分類する
+
+        Args:
+            task_titles (List[str]): 分類対象のタスクタイトルのリスト
+
+        Returns:
+            List[Optional[int]]: 入力と同じ順序のカテゴリの数値
+                                 確信度が低いタイトルはNone
+
+        Raises:
+            Exception: 埋め込みの取得に失敗した場合
+        """
+        centroids = await self._get_centroids()
+        vectors = await self._embed(task_titles)
+
+        results: List[Optional[int]] = []
+        for task_title, vector in zip(task_titles, vectors):
+            scores = sorted(
+                ((sum(a * b for a, b in zip(centroid, vector)), category) for category, centroid in centroids),
+                reverse=True
+            )
+            (best_score, best_category), (second_score, _) = scores[0], scores[1]
+            logger.debug(f"埋め込み分類: {task_title} -> {best_category} (score={best_score:.3f}, margin={best_score - second_score:.3f})")
+            if best_score >= self.min_score and best_score - second_score >= self.min_margin:
+                results.append(best_category)
+            else:
+                results.append(None)
+        return results
+
+    async def _embed(self, texts: List[str]) -> List[List[float]]:
+        """
+        テキストの埋め込みを取得し、L2正規化して返す
+
+        Args:
+            texts (List[str]): 埋め込みを取得するテキストのリスト
+
+        Returns:
+            List[List[float]]: 正規化済みの埋め込みベクトルのリスト
+        """
+        embeddings = await self._model.get_embeddings_async(texts)
+        return [_normalize(embedding.values) for embedding in embeddings]
+
+    async def _get_centroids(self) -> List[Tuple[int, List[float]]]:
+        """
+        カテゴリごとの重心ベクトルを取得する（初回のみ算出）
+
+        Returns:
+            List[Tuple[int, List[float]]]: (カテゴリの数値, 正規化済みの重心ベクトル) のリスト
+        """
+        if self._centroids is not None:
+            return self._centroids
+
+        async with self._lock:
+            if self._centroids is None:
+                if self._model is None:
+                    # モデル情報の取得は同期的な通信を伴うためスレッドで実行
+                    self._model = await asyncio.to_thread(TextEmbeddingModel.from_pretrained, self.model_name)
+
+                seeds = [(category, title) for category, titles in _CATEGORY_SEEDS.items() for title in titles]
+                vectors = await self._embed([title for _, title in seeds])
+
+                sums: Dict[int, List[float]] = {}
+                for (category, _), vector in zip(seeds, vectors):
+                    total = sums.setdefault(category, [0.0] * len(vector))
+                    for j, v in enumerate(vector):
+                        total[j] += v
+                self._centroids = [(category, _normalize(total)) for category, total in sums.items()]
+                logger.info(f"カテゴリの重心ベクトルを算出しました: {self.model_name}")
+        return self._centroids
@@ -1,9 +1,18 @@
 import logging
+from bisect import bisect_right
 from typing import Dict, Tuple
 from src.models.types import StoryPhase
 
 logger = logging.getLogger(__name__)
 
+# フェーズごとの必要経験値の閾値
+# _PHASE_THRESHOLDS = (0, 300, 600, 900, 1000)
+_PHASE_THRESHOLDS = (0, 200, 400, 600, 700)
+# 現在のフェーズ -> 次のフェーズの必要経験値（KANは自身の閾値）
+_NEXT_THRESHOLD = tuple(
+    _PHASE_THRESHOLDS[min(phase + 1, StoryPhase.KAN)] for phase in range(len(_PHASE_THRESHOLDS))
+)
+
 class ExperienceCalculator:
     """
     経験値計算を行うサービス
@@ -19,12 +28,11 @@ class ExperienceCalculator:
     - KAN (4): 完 - 完結 (700+ exp)
     
     Attributes:
-        PHASE_THRESHOLDS: 各フェーズの必要経験値の閾値リスト
+        PHASE_THRESHOLDS: 各フェーズの必要経験値の閾値（昇順のタプル）
     """
     
     # フェーズごとの必要経験値の閾値
-    # PHASE_THRESHOLDS = [0, 300, 600, 900, 1000]
-    PHASE_THRESHOLDS = [0, 200, 400, 600, 700]
+    PHASE_THRESHOLDS = _PHASE_THRESHOLDS
 
     def calculate_experience(self, task_count: int, already_done: int, current_phase: StoryPhase, total_exp: int) -> Tuple[int, bool]:
         """
@@ -71,8 +79,8 @@ class ExperienceCalculator:
         exp = base_exp * task_count
 
         # 次のフェーズの必要経験値を取得
-        next_threshold = self._get_phase_thresholds(min(current_phase + 1, StoryPhase.KAN))
-        logger.debug(f"次のフェーズの必要経験値: {next_threshold}")
+        next_threshold = _NEXT_THRESHOLD[current_phase]
+        logger.debug("次のフェーズの必要経験値: %d", next_threshold)
         
         # 次のフェーズに移行できるかどうかを判定
         is_final_chapter = exp + total_exp >= next_threshold
@@ -80,7 +88,7 @@ class ExperienceCalculator:
         # 次のフェーズの必要経験値を超えないように経験値を制限
         if is_final_chapter:
             exp = next_threshold - total_exp
-            logger.debug(f"経験値を制限: {exp}")
+            logger.debug("経験値を制限: %d", exp)
 
         # 浮動小数点数を整数に変換
         return int(exp), is_final_chapter
@@ -113,7 +121,7 @@ class ExperienceCalculator:
             >>> threshold = calculator._get_phase_thresholds(StoryPhase.SHO)
             >>> print(threshold)  # 200
         """
-        return self.PHASE_THRESHOLDS[phase]
+        return _PHASE_THRESHOLDS[phase]
 
     def get_required_season_exp(self, season_no: int) -> int:
         """
@@ -161,10 +169,5 @@ class ExperienceCalculator:
         if total_exp == 0:
             return StoryPhase.KI
             
-        # 経験値に応じたフェーズを判定
-        for i, threshold in enumerate(self.PHASE_THRESHOLDS):
-            if total_exp < threshold:
-                return StoryPhase(i - 1)
-                
-        # 最大経験値以上の場合はKANを返す
-        return StoryPhase.KAN
\ No newline at end of file
+        # 経験値に応じたフェーズを二分探索で判定（最大経験値以上の場合はKAN）
+        return StoryPhase(min(bisect_right(_PHASE_THRESHOLDS, total_exp) - 1, StoryPhase.KAN))
\ No newline at end of file
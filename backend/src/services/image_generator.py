@@ -1,15 +1,69 @@
 import os
 from typing import Dict, Optional
 import logging
+import random
+import threading
 import replicate
+from replicate.exceptions import ModelError, ReplicateError
 from io import BytesIO
 from PIL import Image
 from .prompt_generator import PromptGenerator
 import io
+import math
 import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
 
 logger = logging.getLogger(__name__)
 
+# 画像生成処理（Replicate呼び出し・ダウンロード・圧縮）専用のスレッド数
+IMAGE_EXECUTOR_MAX_WORKERS = 16
+# リトライ間隔の上限（秒）
+IMAGE_GEN_MAX_RETRY_DELAY = 30
+# 再試行しても結果が変わらないReplicate APIのエラーステータス
+_NON_RETRYABLE_STATUSES = frozenset({400, 401, 402, 403, 404, 422})
+
+# APIトークン -> Replicateクライアント（HTTP接続プールをインスタンス間で共有する）
+_CLIENTS: Dict[str, replicate.Client] = {}
+_executor: Optional[ThreadPoolExecutor] = None
+_lock = threading.Lock()
+
+def _get_client(api_token: str) -> replicate.Client:
+    """
+    共有のReplicateクライアントを取得する
+
+    ImageGeneratorのインスタンスごとにクライアントを生成すると、
+    replicate.comへのTCP/TLS接続もインスタンスごとに張り直しになるため、
+    APIトークンごとに1つのクライアントを生成して使い回します。
+
+    Args:
+        api_token (str): Replicate APIトークン
+
+    Returns:
+        replicate.Client: 共有のクライアントインスタンス
+    """
+    client = _CLIENTS.get(api_token)
+    if client is not None:
+        return client
+
+    with _lock:
+        client = _CLIENTS.get(api_token)
+        if client is None:
+            client = replicate.Client(api_token=api_token)
+            _CLIENTS[api_token] = client
+    return client
+
+def _get_executor() -> ThreadPoolExecutor:
+    """画像生成処理用の共有スレッドプールを取得する"""
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=IMAGE_EXECUTOR_MAX_WORKERS,
+                thread_name_prefix="img"
+            )
+    return _executor
+
 class ImageGenerator:
     """
     ストーリー用の画像を生成するサービス
@@ -22,8 +76,9 @@ class ImageGenerator:
     Attributes:
         model (str): 使用する画像生成モデル（google/imagen-3）
         replicate_token (str): Replicate APIトークン
-        client: Replicateクライアントインスタンス
+        client: Replicateクライアントインスタンス（プロセス内で共有）
         prompt_generator: プロンプト生成サービスインスタンス
+        executor: 画像生成のブロッキング処理を実行する専用スレッドプール（プロセス内で共有）
     """
 
     def __init__(self):
@@ -44,24 +99,31 @@ class ImageGenerator:
         if not self.replicate_token:
             raise ValueError("REPLICATE_API_TOKEN が設定されていません")
         
-        # replicateクライアントの初期化
-        self.client = replicate.Client(api_token=self.replicate_token)
+        # replicateクライアントの取得（プロセス内で共有し、接続を使い回す）
+        self.client = _get_client(self.replicate_token)
         
         # プロンプト生成サービスの初期化
         self.prompt_generator = PromptGenerator()
 
-    def compress_to_target_size(self, image_bytes: bytes, target_size_kb: int = 500, min_quality: int = 60, max_quality: int = 95) -> bytes:
+        # 長時間スレッドを占有する画像処理が、Firestore呼び出し等で使う
+        # デフォルトのスレッドプールを使い切らないよう専用のプールで実行する
+        # プールもインスタンス間で共有し、スレッド数の上限をプロセス全体で保つ
+        self.executor = _get_executor()
+
+    def compress_to_target_size(self, image_bytes: bytes, target_size_kb: int = 500, min_quality: int = 60, max_quality: int = 95, encode_method: int = 4) -> bytes:
         """
         画像を圧縮して指定サイズ以下にする
         
-        WebP形式で画像を圧縮し、指定されたサイズ以下になるまで
-        品質を段階的に下げて最適化します。
+        WebP形式で画像を圧縮し、指定されたサイズ以下に収まる
+        最も高い品質を二分探索で求めます。
         
         Args:
             image_bytes (bytes): 圧縮対象の画像データ
             target_size_kb (int): 目標サイズ（KB単位、デフォルト: 500）
             min_quality (int): 最小品質（デフォルト: 60）
             max_quality (int): 最大品質（デフォルト: 95）
+            encode_method (int): WebPエンコーダの処理レベル0〜6（デフォルト: 4）
+                                 6は最も遅く、4でも圧縮率はほぼ変わらない
             
         Returns:
             bytes: 圧縮された画像データ（WebP形式）
@@ -73,21 +135,63 @@ class ImageGenerator:
             
         Note:
             - WebP形式で圧縮されます
-            - 品質は5刻みで段階的に下げられます
+            - 目標サイズ以下のWebPはそのまま返します
+            - 最初に高速な設定で見積もりを行い、最高品質で収まる場合は探索しません
+            - それ以外は見積もりで絞った範囲を二分探索して品質を決定します
             - 最低品質でも目標サイズを超える場合は最低品質で返されます
         """
+        source_fits = len(image_bytes) <= target_size_kb * 1024
+        # 元画像が既に目標サイズ以下のWebPであれば再エンコードしない
+        if source_fits and image_bytes[:4] == b"RIFF" and image_bytes[8:12] == b"WEBP":
+            return image_bytes
+
         image = Image.open(io.BytesIO(image_bytes))
-        quality = max_quality
-        for q in range(max_quality, min_quality - 1, -5):
-            output = io.BytesIO()
-            image.save(output, format="WebP", quality=q, method=6)
-            size_kb = output.tell() / 1024
-            if size_kb <= target_size_kb:
+        # デコードは1回だけ行い、アルファチャンネルは不要なためRGBに変換しておく
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        image.load()
+
+        # エンコード先のバッファは使い回す
+        output = io.BytesIO()
+
+        def encode(quality: int, method: int) -> float:
+            """指定した品質でエンコードし、サイズ（KB）を返す（メタデータは含めない）"""
+            output.seek(0)
+            output.truncate()
+            image.save(output, format="WebP", quality=quality, method=method, icc_profile=None, exif=b"")
+            return output.tell() / 1024
+
+        if source_fits:
+            # 元画像（PNG等）が目標サイズ以下であれば、WebPでも収まるため見積もりを省く
+            probe_kb = 0.0
+        else:
+            # 最速の設定（method=0）で最高品質時のサイズを見積もる
+            probe_kb = encode(max_quality, 0)
+        hi = max_quality
+        if probe_kb <= target_size_kb:
+            # 最高品質で収まる見込みなら、本番の設定で1回だけエンコードする
+            if encode(max_quality, encode_method) <= target_size_kb:
                 return output.getvalue()
-            quality = q
+            hi = max_quality - 1
+        else:
+            # 見積もりサイズとの比から探索範囲の上限を絞る（methodの差を考慮して余裕を持たせる）
+            estimate = int(max_quality * math.sqrt(target_size_kb / probe_kb)) + 5
+            hi = max(min_quality, min(max_quality, estimate))
+
+        # 目標サイズに収まる最も高い品質を二分探索で求める（品質とサイズは概ね単調）
+        lo = min_quality
+        best = None
+        while lo <= hi:
+            mid = (lo + hi) // 2
+            if encode(mid, encode_method) <= target_size_kb:
+                best = output.getvalue()
+                lo = mid + 1
+            else:
+                hi = mid - 1
+        if best is not None:
+            return best
         # 最低品質でも超える場合は最低品質で返す
-        output = io.BytesIO()
-        image.save(output, format="WebP", quality=min_quality, method=6)
+        encode(min_quality, encode_method)
         return output.getvalue()
 
     async def generate_story_image(self, story_text: str) -> Dict[str, bytes]:
@@ -116,7 +220,8 @@ class ImageGenerator:
             
         Note:
             - 最大リトライ回数は環境変数IMAGE_GEN_MAX_RETRIESで設定可能（デフォルト: 3）
-            - リトライ間隔は指数バックオフで増加します
+            - リトライ間隔はジッター付きの指数バックオフで増加します（上限30秒）
+            - 認証エラーや入力不正などのエラーはリトライしません
             - 生成された画像は500KB以下に自動圧縮されます
             - アスペクト比は1:1（正方形）で生成されます
         """
@@ -138,22 +243,28 @@ class ImageGenerator:
                 # プロンプトの生成（awaitでOK）
                 prompt = await self.prompt_generator.generate_prompt(story_text)
                 
-                # Replicate API呼び出しをスレッドプールで実行
-                output = await asyncio.to_thread(
-                    self.client.run,
-                    "google/imagen-3",
-                    input={
-                        "prompt": prompt,
-                        "aspect_ratio": "1:1",
-                        "safety_filter_level": "block_only_high"
-                    }
+                loop = asyncio.get_running_loop()
+
+                # Replicate API呼び出しを専用スレッドプールで実行
+                output = await loop.run_in_executor(
+                    self.executor,
+                    functools.partial(
+                        self.client.run,
+                        "google/imagen-3",
+                        input={
+                            "prompt": prompt,
+                            "aspect_ratio": "1:1",
+                            "safety_filter_level": "block_only_high"
+                        }
+                    )
                 )
 
                 # 画像データ取得もスレッドで
-                image_data = await asyncio.to_thread(output.read)
+                image_data = await loop.run_in_executor(self.executor, output.read)
 
                 # 画像圧縮もスレッドプールで実行
-                compressed_data = await asyncio.to_thread(
+                compressed_data = await loop.run_in_executor(
+                    self.executor,
                     self.compress_to_target_size,
                     image_data,
                     500
@@ -164,9 +275,17 @@ class ImageGenerator:
                 }
 
             except Exception as e:
+                # 認証エラーや入力不正など、再試行しても成功しないエラーは即座に失敗とする
+                if isinstance(e, ReplicateError) and e.status in _NON_RETRYABLE_STATUSES:
+                    logger.error(f"画像生成エラー（再試行不可）: {str(e)}")
+                    raise Exception(f"画像生成に失敗しました: {str(e)}")
+                # 生成が失敗した場合（セーフティフィルタ等）は、次の試行で別のプロンプトを生成する
+                if isinstance(e, ModelError):
+                    self.prompt_generator.invalidate_prompt(story_text)
                 if attempt < max_retries - 1:
                     logger.warning(f"画像生成リトライ {attempt + 1}/{max_retries}: {str(e)}")
-                    await asyncio.sleep(retry_delay * (attempt + 1))
+                    # 同時に失敗したリクエストが一斉に再試行しないよう、上限付きの指数バックオフにジッターを加える
+                    await asyncio.sleep(random.uniform(0, min(IMAGE_GEN_MAX_RETRY_DELAY, retry_delay * (2 ** attempt))))
                 else:
                     logger.error(f"画像生成エラー（最終）: {str(e)}")
                     raise Exception(f"画像生成に失敗しました（{max_retries}回試行）: {str(e)}")
@@ -1,12 +1,17 @@
+import hashlib
 import logging
 from typing import Dict
 import os
-from dotenv import load_dotenv
-import vertexai
-from vertexai.preview.generative_models import GenerativeModel, GenerationConfig
+from vertexai.preview.generative_models import GenerationConfig
+from src.utils.vertex_client import generate_content, get_generative_model
+from src.utils.cache import TTLCache
 
 logger = logging.getLogger(__name__)
 
+# 生成済みプロンプトのキャッシュ（システムプロンプトとストーリーテキストのハッシュ -> プロンプト）
+PROMPT_CACHE_TTL = 86400
+_prompt_cache = TTLCache(max_entries=512)
+
 class PromptGenerator:
     """
     画像生成用のプロンプトを生成するサービス
@@ -24,17 +29,13 @@ class PromptGenerator:
         """
         PromptGeneratorの初期化
         
-        環境変数を読み込み、Vertex AIを初期化し、
-        プロンプト生成用のシステムプロンプトを設定します。
+        Vertex AIを初期化し、プロンプト生成用のシステムプロンプトを設定します。
+        環境変数はアプリケーション起動時に読み込み済みの前提です。
         
         Raises:
             ValueError: 必要な環境変数が設定されていない場合
             Exception: Vertex AI初期化に失敗した場合
         """
-        # 環境変数の読み込み
-        load_dotenv()
-        self._initialize_vertex_ai()
-        
         # プロンプト生成用のシステムプロンプト
         self.system_prompt = """
 SYSTEM PROMPT: Create a single-sentence image generation prompt for Imagen 3
@@ -54,6 +55,7 @@ Then, write a **single English sentence prompt** (for Imagen 3) that describes t
 - Limit to **under 55 words**
 - Start with: **light novel style fantasy anime illustration**
 - End with a period
+- Output on a single line with no line breaks, headings, or notes
 - Be clear, focused, and descriptive — no overcomplication or redundancy
 
 ---
@@ -144,6 +146,8 @@ Always prefer action over ambiguity.
 - No gore, blood, corpses, or fatal descriptors  
 - Do not use: kill, slay, stab, corpse, blood, brutal, religious or sexualized terms
 """
+        # システムプロンプトはモデルのシステム指示として設定し、リクエストごとに送らない
+        self._initialize_vertex_ai()
 
     def _initialize_vertex_ai(self):
         """
@@ -170,14 +174,8 @@ Always prefer action over ambiguity.
             if not project_id:
                 raise ValueError("GOOGLE_CLOUD_PROJECT環境変数が設定されていません")
             
-            # Vertex AIの初期化
-            vertexai.init(
-                project=project_id,
-                location=location
-            )
-            
-            # モデルの初期化
-            self.model = GenerativeModel(model_name)
+            # Vertex AIの初期化とモデルの取得（システムプロンプトごとにプロセス内で共有）
+            self.model = get_generative_model(project_id, location, model_name, system_instruction=self.system_prompt)
             
         except Exception as e:
             logger.error(f"Vertex AI初期化エラー: {str(e)}")
@@ -211,19 +209,61 @@ Always prefer action over ambiguity.
             - ライトノベル風のアニメイラストスタイル
             - 最終章（結フェーズ）の場面を想定
             - 暴力や不適切な表現は除外される
+            - 同じストーリーテキストに対する結果はキャッシュされる
+        """
+        # 同じストーリーテキスト（通信エラー後のリトライ時など）はキャッシュ済みのプロンプトを再利用
+        # システムプロンプトもキーに含めるため、プロンプトを変更すると自動的に無効になる
+        cache_key = self._cache_key(story_text)
+        return await _prompt_cache.get_or_fetch(
+            cache_key,
+            PROMPT_CACHE_TTL,
+            lambda: self._generate_prompt(story_text)
+        )
+
+    def invalidate_prompt(self, story_text: str) -> None:
+        """
+        ストーリーテキストに対するキャッシュ済みのプロンプトを破棄する
+        
+        生成したプロンプトで画像生成に失敗した場合など、
+        次回は新しいプロンプトを生成させたいときに使用します。
+        
+        Args:
+            story_text (str): プロンプト生成の元となったストーリーテキスト
+        """
+        _prompt_cache.invalidate(self._cache_key(story_text))
+
+    def _cache_key(self, story_text: str) -> str:
+        """システムプロンプトとストーリーテキストからキャッシュキーを生成する"""
+        return hashlib.sha256(f"{self.system_prompt}\0{story_text}".encode()).hexdigest()
+
+    async def _generate_prompt(self, story_text: str) -> str:
+        """
+        Vertex AIでストーリーテキストから画像生成用のプロンプトを生成する
+        
+        Args:
+            story_text (str): プロンプト生成の元となるストーリーテキスト
+            
+        Returns:
+            str: 生成された画像生成用プロンプト（英語）
+            
+        Raises:
+            Exception: プロンプト生成に失敗した場合
         """
         try:
             # 生成設定
             generation_config = GenerationConfig(
                 temperature=0.7,  # 創造性と一貫性のバランスを取る
-                max_output_tokens=256,  # 必要十分な長さ
+                max_output_tokens=100,  # 55単語以内の1文に必要十分な長さ
                 top_p=0.8,  # より多様な表現を許容
-                top_k=40
+                top_k=40,
+                # 1文を出力した後に説明などを続けた場合はそこで打ち切る
+                stop_sequences=["\n\n", "\n---"]
             )
             
             # Vertex AIを使用してプロンプトを生成
-            response = await self.model.generate_content_async(
-                f"{self.system_prompt}\n\n【入力】\n描写: {story_text}",
+            response = await generate_content(
+                self.model,
+                f"【入力】\n描写: {story_text}",
                 generation_config=generation_config
             )
             
@@ -1,8 +1,8 @@
-from collections import defaultdict
 import time
 import os
 from fastapi import HTTPException
 import logging
+from typing import Dict, Tuple
 
 logger = logging.getLogger(__name__)
 
@@ -15,18 +15,24 @@ class RateLimiter:
     
     機能:
     - エンドポイント別のレート制限設定
-    - 時間枠ベースのリクエストカウント
+    - トークンバケット方式によるO(1)のリクエスト判定
     - 過度なリクエストに対する一時的なブロック
     - 環境変数による設定のカスタマイズ
     
     Attributes:
-        requests: クライアントIP別のリクエスト履歴（タイムスタンプのリスト）
+        buckets: (クライアントIP, 制限グループ)別のトークンバケット（残りトークン数, 最終補充時刻）
+        request_counts: クライアントIP別のリクエスト数（時間枠ID, 現在の枠の件数, 前の枠の件数）
         blocked_ips: ブロック中のIPアドレスとブロック終了時刻
         window_size: レート制限の時間枠（秒）
         block_duration: ブロック期間（秒）
         limits: エンドポイント別のレート制限設定
     """
 
+    # 満タンのまま放置されたバケットを破棄するまでの時間（秒）
+    IDLE_TTL = 300
+    # 不要なエントリを掃除する間隔（秒）
+    SWEEP_INTERVAL = 60
+
     def __init__(self):
         """
         RateLimiterの初期化
@@ -44,8 +50,9 @@ class RateLimiter:
             RATE_LIMIT_EXP_UPDATE: 経験値更新の制限
             RATE_LIMIT_READ: 参照系エンドポイントの制限
         """
-        self.requests = defaultdict(list)
-        self.blocked_ips = defaultdict(float)
+        self.buckets = {}
+        self.request_counts = {}
+        self.blocked_ips = {}
         self.window_size = int(os.getenv("RATE_LIMIT_WINDOW_SIZE"))
         self.block_duration = int(os.getenv("RATE_LIMIT_BLOCK_DURATION"))
         self.limits = {
@@ -59,14 +66,17 @@ class RateLimiter:
             # 参照系エンドポイント（共通設定）
             "read": int(os.getenv("RATE_LIMIT_READ")),  # 1分間に30回まで
         }
+        # エンドポイント名 -> (制限グループ, 制限値)（初回参照時に解決して保持）
+        self._resolved: Dict[str, Tuple[str, int]] = {}
+        self._last_sweep = time.monotonic()
 
     def check_limit(self, key: str, endpoint: str) -> bool:
         """
         レート制限をチェックし、必要に応じてブロックを実行する
         
         指定されたキー（通常はIPアドレス）とエンドポイントに対して
-        レート制限をチェックします。制限を超過した場合は適切な
-        エラーレスポンスを返します。
+        トークンバケット方式でレート制限をチェックします。バケットは
+        時間枠あたり制限値の速度で補充され、1リクエストごとに1トークンを消費します。
         
         Args:
             key (str): クライアントの識別子（通常はIPアドレス）
@@ -83,61 +93,113 @@ class RateLimiter:
             - 1分間に60回以上のリクエストがあると一時的なブロックが実行される
             - ブロック期間中は429エラーが返される
         """
-        now = time.time()
+        now = time.monotonic()
+        
+        logger.debug("Rate limit check - Key: %s, Endpoint: %s", key, endpoint)
         
-        # デバッグログの追加
-        logger.debug(f"Rate limit check - Key: {key}, Endpoint: {endpoint}")
-        logger.debug(f"Current requests: {self.requests[key]}")
-        logger.debug(f"Window size: {self.window_size}, Block duration: {self.block_duration}")
-        logger.debug(f"Limit for {endpoint}: {self.limits.get(endpoint)}")
+        if now - self._last_sweep >= self.SWEEP_INTERVAL:
+            self._sweep(now)
         
         # ブロック状態のチェック
-        if key in self.blocked_ips:
-            if now < self.blocked_ips[key]:
-                logger.debug(f"IP {key} is blocked until {self.blocked_ips[key]}")
+        blocked_until = self.blocked_ips.get(key)
+        if blocked_until is not None:
+            if now < blocked_until:
+                logger.debug("IP %s is blocked until %s", key, blocked_until)
                 raise HTTPException(
                     status_code=429,
-                    detail=f"レート制限を超過したため、{int((self.blocked_ips[key] - now) / 60)}分間ブロックされています。"
+                    detail=f"レート制限を超過したため、{int((blocked_until - now) / 60)}分間ブロックされています。"
                 )
             else:
                 del self.blocked_ips[key]
-                logger.debug(f"Block for IP {key} has expired")
-        
-        # 時間枠内のリクエストのみを保持
-        window_start = now - self.window_size
-        self.requests[key] = [t for t in self.requests[key] if t > window_start]
-        logger.debug(f"Requests in current window: {len(self.requests[key])}")
-        
-        # 参照系エンドポイントの場合は共通の制限を適用
-        if endpoint.startswith("GET_"):
-            limit = self.limits.get("read")
-        else:
-            limit = self.limits.get(endpoint)
+                logger.debug("Block for IP %s has expired", key)
+        
+        resolved = self._resolved.get(endpoint)
+        if resolved is None:
+            resolved = self._resolve(endpoint)
+        limit_key, limit = resolved
             
         if not limit:
-            logger.debug(f"No limit set for endpoint {endpoint}")
+            logger.debug("No limit set for endpoint %s", endpoint)
             return False
-            
-        # 現在の時間枠内のリクエスト数を確認
-        current_requests = len(self.requests[key])
-        logger.debug(f"Current requests: {current_requests}, Limit: {limit}")
         
-        if current_requests >= limit:
+        # 直近の時間枠内のリクエスト数（ブロック判定用、スライディングウィンドウカウンタ）
+        window_id = int(now // self.window_size)
+        stored_window, current_count, previous_count = self.request_counts.get(key, (window_id, 0, 0))
+        if stored_window != window_id:
+            # 時間枠が進んだ場合は現在の件数を前の枠に移す（2枠以上空いた場合は0）
+            previous_count = current_count if stored_window == window_id - 1 else 0
+            current_count = 0
+        elapsed_ratio = (now % self.window_size) / self.window_size
+        current_requests = previous_count * (1 - elapsed_ratio) + current_count
+        
+        # トークンを補充（時間枠あたりlimit個）
+        bucket_key = (key, limit_key)
+        tokens, last_refill = self.buckets.get(bucket_key, (limit, now))
+        tokens = min(limit, tokens + (now - last_refill) * limit / self.window_size)
+        logger.debug("Tokens: %.2f, Limit: %s", tokens, limit)
+        
+        if tokens < 1:
+            self.buckets[bucket_key] = (tokens, now)
             # 1分間に60回以上のリクエストがあった場合、ブロックを開始
             if current_requests >= 60:
                 self.blocked_ips[key] = now + self.block_duration
-                logger.debug(f"IP {key} blocked for {self.block_duration} seconds")
+                logger.debug("IP %s blocked for %s seconds", key, self.block_duration)
                 raise HTTPException(
                     status_code=429,
                     detail=f"レート制限を大幅に超過したため、{self.block_duration / 60}分間ブロックされます。"
                 )
-            logger.debug(f"Rate limit exceeded for {endpoint}")
+            logger.debug("Rate limit exceeded for %s", endpoint)
             return True
             
-        self.requests[key].append(now)
-        logger.debug(f"Request added to counter for {endpoint}")
+        self.buckets[bucket_key] = (tokens - 1, now)
+        self.request_counts[key] = (window_id, current_count + 1, previous_count)
+        logger.debug("Token consumed for %s", endpoint)
         return False
 
+    def _sweep(self, now: float) -> None:
+        """
+        不要になったレート制限の状態を削除する
+        
+        満タンまで補充されたまま一定時間使われていないバケット、
+        前の時間枠よりも古いリクエスト数、期限切れのブロックを削除し、
+        クライアント数に応じてメモリが増え続けないようにします。
+        
+        Args:
+            now (float): 現在時刻（time.monotonic）
+        """
+        self._last_sweep = now
+        idle_before = now - self.IDLE_TTL
+        for bucket_key, (tokens, last_refill) in list(self.buckets.items()):
+            if last_refill >= idle_before:
+                continue
+            limit = self.limits.get(bucket_key[1], 0)
+            if tokens + (now - last_refill) * limit / self.window_size >= limit:
+                del self.buckets[bucket_key]
+        window_id = int(now // self.window_size)
+        for key, (stored_window, _, _) in list(self.request_counts.items()):
+            if stored_window < window_id - 1:
+                del self.request_counts[key]
+        for key, blocked_until in list(self.blocked_ips.items()):
+            if now >= blocked_until:
+                del self.blocked_ips[key]
+
+    def _resolve(self, endpoint: str) -> Tuple[str, int]:
+        """
+        エンドポイントに適用する制限グループと制限値を解決して保持する
+        
+        参照系エンドポイント（GET_で始まる）は共通の制限（read）を適用します。
+        
+        Args:
+            endpoint (str): エンドポイント名
+            
+        Returns:
+            Tuple[str, int]: (制限グループ, 制限値（設定されていない場合は0）)
+        """
+        limit_key = "read" if endpoint.startswith("GET_") else endpoint
+        resolved = (limit_key, self.limits.get(limit_key, 0))
+        self._resolved[endpoint] = resolved
+        return resolved
+
     def get_limit(self, endpoint: str) -> int:
         """
         指定されたエンドポイントのレート制限値を取得する
@@ -148,5 +210,10 @@ class RateLimiter:
         Returns:
             int: エンドポイントのレート制限値（設定されていない場合は0）
             
+        Note:
+            参照系エンドポイント（GET_で始まる）は共通の制限値を返します
         """
-        return self.limits.get(endpoint, 0) 
\ No newline at end of file
+        resolved = self._resolved.get(endpoint)
+        if resolved is None:
+            resolved = self._resolve(endpoint)
+        return resolved[1] 
\ No newline at end of file
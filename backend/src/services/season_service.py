@@ -1,21 +1,37 @@
-from typing import List, Dict, Tuple, Optional
+from typing import List, Dict, Tuple, Optional, Set
 from google.cloud import firestore
 from fastapi import HTTPException
 from src.models.types import TaskStatus, ErrorMessages, StoryPhase, Task, Season, User, Story
 from src.services.experience_calculator import ExperienceCalculator
 from src.services.story_service import StoryService
-from src.services.task_service import TaskService
+from src.services.task_service import TaskService, FIRESTORE_BATCH_LIMIT
 from src.services.image_generator import ImageGenerator
 from src.services.storage_service import StorageService
 from datetime import datetime, timedelta
 from google.cloud.firestore import FieldFilter, Transaction
-from src.utils.encoders import custom_json_response, custom_encoder
 import json
 import logging
 import asyncio
+import os
 
 logger = logging.getLogger(__name__)
 
+# 画像生成（生成・ダウンロード・アップロード）の同時実行数を制限するセマフォ
+_image_semaphore: Optional[asyncio.Semaphore] = None
+
+def _get_image_semaphore() -> asyncio.Semaphore:
+    """
+    画像生成の同時実行数を制限するセマフォを取得する
+
+    最終章が同時に多数生成された場合に、Replicateのクォータ超過や
+    画像データの保持によるメモリ不足を避けるため、
+    IMAGE_GEN_CONCURRENCY（デフォルト4）件までに制限します。
+    """
+    global _image_semaphore
+    if _image_semaphore is None:
+        _image_semaphore = asyncio.Semaphore(int(os.getenv("IMAGE_GEN_CONCURRENCY", "4")))
+    return _image_semaphore
+
 class SeasonService:
     def __init__(self, db: firestore.Client):
         self.db = db
@@ -24,18 +40,23 @@ class SeasonService:
         self.task_service = TaskService(db)
         self.image_generator = ImageGenerator()
         self.storage_service = StorageService()
+        # 実行中のバックグラウンドタスク（画像生成など）
+        self._background_tasks: Set[asyncio.Task] = set()
 
     async def create_initial_season(self, user: User) -> Tuple[Season, User]:
         """
         ユーザーの初期シーズンを作成し、ユーザー情報を更新
         
+        Firestoreへの保存は行いません。ユーザー作成時に呼び出し側が
+        ユーザーとシーズンを1回のバッチ書き込みでまとめて保存します。
+        
         Args:
             user (User): ユーザー情報
             
         Returns:
             Tuple[Season, User]: 作成されたシーズンと更新されたユーザー情報
         """
-        return await self._create_season_with_user_update(user, 1, "")
+        return self._build_season(user, 1, "")
 
     async def create_new_season(self, user: User, season_number: int, previous_summary: str) -> Tuple[Season, User]:
         """
@@ -50,20 +71,20 @@ class SeasonService:
         """
         return await self._create_season_with_user_update(user, season_number, previous_summary)
 
-    async def _create_season_with_user_update(self, user: User, season_number: int, previous_summary: str) -> Tuple[Season, User]:
+    def _build_season(self, user: User, season_number: int, previous_summary: str) -> Tuple[Season, User]:
         """
-        シーズンを作成し、ユーザー情報を更新する内部メソッド
+        シーズンを生成し、ユーザー情報に反映する内部メソッド（Firestoreへの保存は行わない）
         
         Args:
             user (User): ユーザー情報
             season_number (int): シーズン番号
+            previous_summary (str): 前シーズンの要約
             
         Returns:
-            Tuple[Season, User]: 作成されたシーズンと更新されたユーザー情報
+            Tuple[Season, User]: 生成されたシーズンと更新されたユーザー情報
         """
-        # 参照を取得
-        user_ref = self.db.collection('users').document(user.id)
-        season_ref = user_ref.collection('seasons').document()
+        # シーズンIDを採番
+        season_ref = self.db.collection('users').document(user.id).collection('seasons').document()
         
         try:
             # シーズンを作成
@@ -80,7 +101,6 @@ class SeasonService:
             )
 
             season.id = season_ref.id
-            season_dict = season.model_dump()
             
             # ユーザー情報を更新
             user.current_season_id = season.id
@@ -88,12 +108,41 @@ class SeasonService:
                 user.season_ids = []
             user.season_ids.append(season.id)
             
-            # 更新を実行
-            season_ref.set(season_dict)
-            user_ref.update({
+            return season, user
+            
+        except Exception as e:
+            raise HTTPException(
+                status_code=500,
+                detail=f"シーズン作成中にエラーが発生しました: {str(e)}"
+            )
+
+    async def _create_season_with_user_update(self, user: User, season_number: int, previous_summary: str) -> Tuple[Season, User]:
+        """
+        シーズンを作成し、ユーザー情報を更新する内部メソッド
+        
+        Args:
+            user (User): ユーザー情報
+            season_number (int): シーズン番号
+            
+        Returns:
+            Tuple[Season, User]: 作成されたシーズンと更新されたユーザー情報
+        """
+        season, user = self._build_season(user, season_number, previous_summary)
+        
+        # 参照を取得
+        user_ref = self.db.collection('users').document(user.id)
+        season_ref = user_ref.collection('seasons').document(season.id)
+        
+        try:
+            # シーズンの作成とユーザーの更新を1回のバッチ書き込みで実行
+            batch = self.db.batch()
+            batch.set(season_ref, season.model_dump())
+            batch.update(user_ref, {
                 'current_season_id': season.id,
-                'season_ids': user.season_ids
+                # 配列全体を書き戻さず、追加分のみを送る
+                'season_ids': firestore.ArrayUnion([season.id])
             })
+            await asyncio.to_thread(batch.commit)
             
             return season, user
             
@@ -113,25 +162,27 @@ class SeasonService:
             story (Story): ストーリー情報
         """
         try:
-            # 画像生成
-            image_result = await self.image_generator.generate_story_image(story.content)
-            # GCSに画像を保存
-            bucket_name = "todo-adv"
-            file_name = f"season_{season.season_no}.png"
-            storage_path = f"images/user_{user_id}/{file_name}"
-            
-            # GCSに画像をアップロード
-            await self.storage_service.upload_image(
-                bucket_name=bucket_name,
-                storage_path=storage_path,
-                image_data=image_result["image_data"]
-            )
-            
-            # シーズンに画像パスを保存
-            await self.save_story_image(user_id, season.id, file_name)
+            # 同時実行数を制限（上限に達している場合は空きを待つ）
+            async with _get_image_semaphore():
+                # 画像生成
+                image_result = await self.image_generator.generate_story_image(story.content)
+                # GCSに画像を保存
+                bucket_name = "todo-adv"
+                file_name = f"season_{season.season_no}.png"
+                storage_path = f"images/user_{user_id}/{file_name}"
+                
+                # GCSに画像をアップロード
+                await self.storage_service.upload_image(
+                    bucket_name=bucket_name,
+                    storage_path=storage_path,
+                    image_data=image_result["image_data"]
+                )
+                
+                # シーズンに画像パスを保存
+                await self.save_story_image(user_id, season.id, file_name)
             
         except Exception as e:
-            logger.error(f"画像生成・保存エラー: {str(e)}")
+            logger.error("画像生成・保存エラー: %s", e)
             # 画像生成に失敗しても処理は続行
 
     async def progress_story(self, user_id: str, client_update_at: str = None) -> Dict:
@@ -148,9 +199,9 @@ class SeasonService:
         Raises:
             HTTPException: ユーザーまたはシーズンが見つからない場合
         """
-        # ユーザーとシーズンを1回のトランザクションで取得
+        # ユーザーを取得（現在のシーズンIDを得るため先に取得する）
         user_ref = self.db.collection('users').document(user_id)
-        user_doc = user_ref.get()
+        user_doc = await asyncio.to_thread(user_ref.get)
         if not user_doc.exists:
             raise HTTPException(status_code=404, detail=ErrorMessages.USER_NOT_FOUND)
         
@@ -158,27 +209,27 @@ class SeasonService:
         if not user.current_season_id:
             raise HTTPException(status_code=404, detail=ErrorMessages.SEASON_NOT_FOUND)
             
+        # シーズン・完了したタスク・当日完了したタスク数は互いに独立しているため並行して取得
         season_ref = user_ref.collection('seasons').document(user.current_season_id)
-        season_doc = season_ref.get()
+        season_doc, completed_tasks, already_done = await asyncio.gather(
+            asyncio.to_thread(season_ref.get),
+            asyncio.to_thread(self.task_service.get_completed_tasks, user_id),
+            asyncio.to_thread(self.task_service.count_already_done_tasks, user_id)
+        )
         if not season_doc.exists:
             raise HTTPException(status_code=404, detail=ErrorMessages.SEASON_NOT_FOUND)
         current_season = Season(**season_doc.to_dict())
-            
-        # 完了したタスクを取得
-        completed_tasks = self.task_service.get_completed_tasks(user_id)
-        logger.debug(f"完了したタスク数: {len(completed_tasks) if completed_tasks else 0}")
-        # 当日完了したタスクを取得
-        already_done = self.task_service.count_already_done_tasks(user_id)
-        logger.debug(f"当日既に完了したタスク数: {already_done}")
+        logger.debug("完了したタスク数: %s", len(completed_tasks) if completed_tasks else 0)
+        logger.debug("当日既に完了したタスク数: %s", already_done)
 
         # 完了したタスクのseason_idを更新（experienced_atはまだ更新しない）
         if completed_tasks:  # 完了したタスクが存在する場合のみ更新
-            self.task_service.update_tasks_season_id(completed_tasks, user_id, current_season.id)
+            await asyncio.to_thread(self.task_service.update_tasks_season_id, completed_tasks, user_id, current_season.id)
         
         # 経験値を計算して加算
         earned_exp, is_final_chapter = self.exp_calculator.calculate_experience(len(completed_tasks), already_done, current_season.current_phase, current_season.total_exp)
-        logger.debug(f"獲得経験値: {earned_exp}")
-        logger.debug(f"最終章判定: {is_final_chapter}")
+        logger.debug("獲得経験値: %s", earned_exp)
+        logger.debug("最終章判定: %s", is_final_chapter)
         
         # 獲得経験値が0の場合はストーリーを生成せずに終了
         if earned_exp == 0:
@@ -190,43 +241,62 @@ class SeasonService:
             }
             
         current_season.total_exp = int(current_season.total_exp + earned_exp)
-        logger.debug(f"総経験値: {current_season.total_exp}")
+        logger.debug("総経験値: %s", current_season.total_exp)
         # フェーズを更新
         current_season.current_phase = self.exp_calculator.get_phase(current_season.total_exp)
-        logger.debug(f"現在のフェーズ: {current_season.current_phase}")
+        logger.debug("現在のフェーズ: %s", current_season.current_phase)
         
         # 物語を生成
-        story = await self.story_service.generate_story(user, current_season, is_final_chapter)
+        # 完了したタスクは取得済みのものを渡し、同じクエリを再実行しない
+        story = await self.story_service.generate_story(user, current_season, is_final_chapter, completed_tasks)
+
+        # ストーリー・シーズン・ユーザーの更新は1回のバッチ書き込みでまとめて保存
+        batch = self.db.batch()
 
         # ストーリーを保存
         story_ref = season_ref.collection('stories').document()
         story.id = story_ref.id
         story.season_id = current_season.id
-        story_ref.set(story.model_dump())
+        batch.set(story_ref, story.model_dump())
 
         # シーズンを更新
-        await self._update_season(user_id, current_season, story)
-
-        # 物語の最終章かつ結のフェーズの場合、画像を生成（非同期で実行）
-        if is_final_chapter and current_season.current_phase == StoryPhase.KETSU:
-            # awaitを外して非同期実行
-            asyncio.create_task(self._generate_and_save_story_image(user_id, current_season, story))
-
-        # 完了済タスクのexperienced_atを更新（行動分析後に実行）
-        if completed_tasks:
-            self.task_service.update_tasks_to_experienced(completed_tasks, user_id)
+        self._update_season(batch, user_id, current_season, story)
 
         # シーズンが完結したら新シーズンを作成し、ユーザー情報を更新
         new_season = None
+        user_update = {}
         if current_season.current_phase == StoryPhase.KAN:
-            new_season, updated_user = await self.create_new_season(user, current_season.season_no + 1, story.summary)
-            user = updated_user
+            new_season, user = self._build_season(user, current_season.season_no + 1, story.summary)
+            batch.set(user_ref.collection('seasons').document(new_season.id), new_season.model_dump())
+            user_update['current_season_id'] = new_season.id
+            # 配列全体を書き戻さず、追加分のみを送る
+            user_update['season_ids'] = firestore.ArrayUnion([new_season.id])
         
         # 更新日時を更新
-        current_time = datetime.now().isoformat()
-        user_ref.update({
-            'update_at': current_time
-        })
+        user_update['update_at'] = datetime.now().isoformat()
+        batch.update(user_ref, user_update)
+
+        # 完了済タスクのexperienced_atの更新は、ストーリーの保存に失敗した場合に
+        # 経験値が失われないよう、ストーリー・シーズン・ユーザーの更新と同じバッチでコミットする
+        # （上限を超える場合はストーリーの保存後に別途更新する）
+        batch_ops = len(completed_tasks) + (4 if new_season else 3)
+        if completed_tasks and batch_ops <= FIRESTORE_BATCH_LIMIT:
+            self.task_service.add_experienced_updates(batch, completed_tasks, user_id)
+            await asyncio.to_thread(batch.commit)
+        else:
+            await asyncio.to_thread(batch.commit)
+            if completed_tasks:
+                # 同じタスクで経験値を二重に獲得しないよう、レスポンスを返す前に完了させる
+                await asyncio.to_thread(self.task_service.update_tasks_to_experienced, completed_tasks, user_id)
+        # 次の章の生成で前章を再取得しないよう、保存したストーリーを記録
+        self.story_service.remember_latest_story(user_id, story)
+
+        # 物語の最終章かつ結のフェーズの場合、画像を生成（非同期で実行）
+        if is_final_chapter and current_season.current_phase == StoryPhase.KETSU:
+            # awaitを外して非同期実行（完了までGCで破棄されないよう参照を保持する）
+            task = asyncio.create_task(self._generate_and_save_story_image(user_id, current_season, story))
+            self._background_tasks.add(task)
+            task.add_done_callback(self._background_tasks.discard)
         
         # 更新処理後の排他チェック
         if client_update_at:
@@ -252,7 +322,7 @@ class SeasonService:
     async def _get_user(self, user_id: str) -> User:
         """ユーザー情報を取得"""
         user_ref = self.db.collection('users').document(user_id)
-        user = user_ref.get()
+        user = await asyncio.to_thread(user_ref.get)
         if not user.exists:
             raise HTTPException(status_code=404, detail=ErrorMessages.USER_NOT_FOUND)
         return User(**user.to_dict())
@@ -264,56 +334,60 @@ class SeasonService:
             
         user_ref = self.db.collection('users').document(user.id)
         season_ref = user_ref.collection('seasons').document(user.current_season_id)
-        season = season_ref.get()
+        season = await asyncio.to_thread(season_ref.get)
         if not season.exists:
             raise HTTPException(status_code=404, detail=ErrorMessages.SEASON_NOT_FOUND)
         return Season(**season.to_dict())
 
-    async def _update_season(self, user_id: str, season: Season, story: Story) -> None:
-        """シーズン情報を更新"""
+    def _update_season(self, batch: firestore.WriteBatch, user_id: str, season: Season, story: Story) -> None:
+        """シーズン情報の更新をバッチに追加"""
         user_ref = self.db.collection('users').document(user_id)
         season_ref = user_ref.collection('seasons').document(season.id)
         season.current_chapter += 1
         season.updated_at = datetime.now()
-        logger.debug(f"シーズン更新 - フェーズ: {season.current_phase}")
+        logger.debug("シーズン更新 - フェーズ: %s", season.current_phase)
         update_data = {
             'total_exp': season.total_exp,
             'current_phase': season.current_phase,
             'current_chapter': season.current_chapter,
             'updated_at': season.updated_at
         }
-        season_ref.update(update_data)
+        batch.update(season_ref, update_data)
 
-    def get_seasons_for_dashboard(self, user_ref: firestore.DocumentReference, season_ids: List[str]) -> List[Dict]:
-        """ダッシュボード用のシーズン一覧を取得（ストーリーを含む）"""
-        # ユーザー情報からcurrent_season_idを取得
-        user_doc = user_ref.get()
-        user_data = user_doc.to_dict()
-        current_season_id = user_data.get('current_season_id')
-
-        seasons = []
-        for season_id in season_ids:
-            season_ref = user_ref.collection('seasons').document(season_id)
-            season = season_ref.get()
-            if season.exists:
-                season_dict = season.to_dict()
-                
-                # 現在のシーズンの場合のみストーリーを取得
-                if season_id == current_season_id:
-                    stories_ref = season_ref.collection('stories')
-                    # ストーリーをchapter_noの降順で取得
-                    stories = stories_ref.order_by('chapter_no', direction=firestore.Query.DESCENDING).stream()
-                    stories_list = [story.to_dict() for story in stories]
-                    season_dict['stories'] = stories_list
-                else:
-                    season_dict['stories'] = []
-                
-                seasons.append(season_dict)
+    def get_seasons_for_dashboard(self, user_ref: firestore.DocumentReference) -> List[Dict]:
+        """
+        ダッシュボード用のシーズン一覧を取得（ストーリーは含まない）
+        
+        ユーザー情報のseason_idsに依存せずサブコレクションを直接読むため、
+        ユーザー情報の取得と並行して実行できます。
+        
+        Args:
+            user_ref (firestore.DocumentReference): ユーザーの参照
+            
+        Returns:
+            List[Dict]: シーズン一覧（season_noの降順）
+        """
+        seasons = [season.to_dict() for season in user_ref.collection('seasons').stream()]
         
         # シーズンをseason_noの降順でソート
         seasons.sort(key=lambda x: x.get('season_no', 0), reverse=True)
         return seasons
 
+    def get_stories_for_dashboard(self, user_ref: firestore.DocumentReference, season_id: str) -> List[Dict]:
+        """
+        ダッシュボード用に指定シーズンのストーリー一覧を取得
+        
+        Args:
+            user_ref (firestore.DocumentReference): ユーザーの参照
+            season_id (str): シーズンID
+            
+        Returns:
+            List[Dict]: ストーリー一覧（chapter_noの降順）
+        """
+        stories_ref = user_ref.collection('seasons').document(season_id).collection('stories')
+        stories = stories_ref.order_by('chapter_no', direction=firestore.Query.DESCENDING).stream()
+        return [story.to_dict() for story in stories]
+
     async def save_story_image(self, user_id: str, season_id: str, file_name: str) -> None:
         """
         シーズンに画像ファイル名を保存します。
@@ -326,12 +400,12 @@ class SeasonService:
         try:
             user_ref = self.db.collection('users').document(user_id)
             season_ref = user_ref.collection('seasons').document(season_id)
-            season_ref.update({
+            await asyncio.to_thread(season_ref.update, {
                 'story_image_filename': file_name
             })
-            logger.info(f"画像ファイル名を保存しました: user_id={user_id}, season_id={season_id}")
+            logger.info("画像ファイル名を保存しました: user_id=%s, season_id=%s", user_id, season_id)
         except Exception as e:
-            logger.error(f"画像ファイル名の保存に失敗: {str(e)}")
+            logger.error("画像ファイル名の保存に失敗: %s", e)
             raise Exception(f"画像ファイル名の保存に失敗しました: {str(e)}")
 
     async def get_story_image_url(self, season_id: str) -> Optional[str]:
@@ -347,7 +421,7 @@ class SeasonService:
         try:
             # シーズンの取得
             season_ref = self.db.collection('seasons').document(season_id)
-            season_doc = season_ref.get()
+            season_doc = await asyncio.to_thread(season_ref.get)
             
             if not season_doc.exists:
                 raise Exception("シーズンが見つかりません")
@@ -365,7 +439,7 @@ class SeasonService:
             return image_url
             
         except Exception as e:
-            logger.error(f"画像URLの取得に失敗: {str(e)}")
+            logger.error("画像URLの取得に失敗: %s", e)
             raise Exception(f"画像URLの取得に失敗しました: {str(e)}")
 
     async def generate_and_save_story_image(self, user_id: str, season_id: str, story_text: str, style: str = "light_novel") -> dict:
@@ -382,12 +456,13 @@ class SeasonService:
             dict: 生成された画像の情報
         """
         try:
-            # 画像の生成
-            result = await self.image_generator.generate_story_image(
-                story_text=story_text,
-                story_id=season_id,
-                style=style
-            )
+            # 画像の生成（同時実行数を制限）
+            async with _get_image_semaphore():
+                result = await self.image_generator.generate_story_image(
+                    story_text=story_text,
+                    story_id=season_id,
+                    style=style
+                )
             
             # 画像ファイル名の保存
             await self.save_story_image(user_id, season_id, result['filename'])
@@ -395,5 +470,5 @@ class SeasonService:
             return result
             
         except Exception as e:
-            logger.error(f"画像の生成と保存に失敗: {str(e)}")
+            logger.error("画像の生成と保存に失敗: %s", e)
             raise Exception(f"画像の生成と保存に失敗しました: {str(e)}")
@@ -1,12 +1,60 @@
 from google.cloud import storage
+import asyncio
 import logging
-from typing import Optional
+import threading
+from typing import Any, Optional, Dict
+from src.utils.cache import TTLCache
 
 logger = logging.getLogger(__name__)
 
+# 署名付きURLの最大キャッシュ件数
+SIGNED_URL_CACHE_SIZE = 4096
+# (バケット名, パス, 有効期限) -> 署名付きURL
+_signed_url_cache = TTLCache(max_entries=SIGNED_URL_CACHE_SIZE)
+
+# 認証情報 -> storage.Client（HTTPセッションをインスタンス間で共有する）
+_CLIENTS: Dict[Any, storage.Client] = {}
+_lock = threading.Lock()
+
+def _get_client(credentials=None) -> storage.Client:
+    """
+    共有のstorage.Clientを取得する
+
+    StorageServiceはmain.pyとSeasonServiceでそれぞれ生成されるため、
+    認証情報ごとに1つのクライアントを生成して使い回します。
+
+    Args:
+        credentials: 認証情報（Noneの場合はアプリケーションのデフォルト認証情報）
+
+    Returns:
+        storage.Client: 共有のクライアントインスタンス
+    """
+    client = _CLIENTS.get(credentials)
+    if client is not None:
+        return client
+
+    with _lock:
+        client = _CLIENTS.get(credentials)
+        if client is None:
+            client = storage.Client(credentials=credentials)
+            _CLIENTS[credentials] = client
+    return client
+
 class StorageService:
+    # 残り有効期間がこれより短いキャッシュ済みURLは再生成する（秒）
+    SIGNED_URL_MIN_REMAINING = 60
+
     def __init__(self, credentials=None):
-        self.storage_client = storage.Client(credentials=credentials)
+        self.storage_client = _get_client(credentials)
+        # バケット名 -> バケット
+        self._buckets: Dict[str, storage.Bucket] = {}
+
+    def _get_bucket(self, bucket_name: str) -> storage.Bucket:
+        """バケットの参照を取得する（バケット名ごとに使い回す）"""
+        bucket = self._buckets.get(bucket_name)
+        if bucket is None:
+            bucket = self._buckets[bucket_name] = self.storage_client.bucket(bucket_name)
+        return bucket
 
     async def upload_image(self, bucket_name: str, storage_path: str, image_data: bytes) -> Optional[str]:
         """
@@ -24,13 +72,14 @@ class StorageService:
             logger.debug(f"bucket_name: {bucket_name}")
             logger.debug(f"storage_path: {storage_path}")
             # バケットの取得
-            bucket = self.storage_client.bucket(bucket_name)
+            bucket = self._get_bucket(bucket_name)
             
             # 新しいBlobを作成
             blob = bucket.blob(storage_path)
             
-            # 画像データをアップロード
-            blob.upload_from_string(
+            # 画像データをアップロード（通信中にイベントループを止めないようスレッドで実行）
+            await asyncio.to_thread(
+                blob.upload_from_string,
                 image_data,
                 content_type='image/png'
             )
@@ -53,18 +102,30 @@ class StorageService:
             
         Returns:
             str: 署名付きURL
+            
+        Note:
+            生成したURLはキャッシュし、残り有効期間が十分あれば再署名せずに返します。
+            同じURLの生成が同時に要求された場合は1回の署名にまとめます。
         """
-        try:
-            bucket = self.storage_client.bucket(bucket_name)
+        async def sign() -> str:
+            bucket = self._get_bucket(bucket_name)
             blob = bucket.blob(storage_path)
             
-            url = blob.generate_signed_url(
+            # RSA署名はCPU負荷が高いためスレッドで実行
+            return await asyncio.to_thread(
+                blob.generate_signed_url,
                 version="v4",
                 expiration=expiration,
                 method="GET"
             )
-            
-            return url
+
+        try:
+            # 残り有効期間がSIGNED_URL_MIN_REMAININGを下回る前にキャッシュを失効させる
+            return await _signed_url_cache.get_or_fetch(
+                (bucket_name, storage_path, expiration),
+                max(expiration - self.SIGNED_URL_MIN_REMAINING, 0),
+                sign
+            )
             
         except Exception as e:
             logger.error(f"署名付きURL生成エラー: {str(e)}")
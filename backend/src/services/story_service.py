@@ -1,10 +1,17 @@
-from typing import List
+import asyncio
+from typing import List, Optional
 from datetime import datetime
 from google.cloud import firestore
 from src.models.types import Story, StoryPhase
-from src.models.types import User, Season
+from src.models.types import User, Season, Task
 from src.services.story_generator import StoryGenerator
 from src.services.task_service import TaskService
+from src.utils.cache import TTLCache
+
+# (ユーザーID, シーズンID) -> シーズンの最新のストーリー
+# 保存時に更新し、次の章の生成時に前章を取得するFirestoreへの問い合わせを省略する
+LATEST_STORY_CACHE_TTL = 86400
+_latest_story_cache = TTLCache(max_entries=4096)
 
 class StoryService:
     def __init__(self, db: firestore.Client):
@@ -12,16 +19,17 @@ class StoryService:
         self.story_generator = StoryGenerator(db)
         self.task_service = TaskService(db)
 
-    async def generate_story(self, user: User, season: Season, is_final_chapter: bool = False) -> Story:
-        """経験値に基づいてストーリーを生成"""
+    async def generate_story(self, user: User, season: Season, is_final_chapter: bool = False, completed_tasks: Optional[List[Task]] = None) -> Story:
+        """経験値に基づいてストーリーを生成（completed_tasksが渡された場合は再取得しない）"""
         # 完了したタスクを取得
-        completed_tasks = self.task_service.get_completed_tasks(user.id)
+        if completed_tasks is None:
+            completed_tasks = await asyncio.to_thread(self.task_service.get_completed_tasks, user.id)
         completed_task_titles = [task.title for task in completed_tasks]
         
         # 前章の要約を取得
         previous_summary = ""
         if season.current_chapter > 0:
-            previous_story = await self._get_previous_story(user.id, season.id)
+            previous_story = await self._get_previous_story(user.id, season.id, season.current_chapter)
             if previous_story:
                 previous_summary = previous_story.summary or ""
         else:
@@ -64,23 +72,51 @@ class StoryService:
     async def _update_user_player_name(self, user_id: str, player_name: str) -> None:
         """ユーザーのplayer_nameを更新"""
         user_ref = self.db.collection('users').document(user_id)
-        user_ref.update({
+        await asyncio.to_thread(user_ref.update, {
             'player_name': player_name
         })
 
-    async def _get_previous_story(self, user_id: str, season_id: str) -> Story:
-        """前章のストーリーを取得"""
+    def remember_latest_story(self, user_id: str, story: Story) -> None:
+        """
+        保存したストーリーをシーズンの最新のストーリーとして記録する
+
+        Firestoreへの保存が完了した後に呼び出してください。
+
+        Args:
+            user_id (str): ユーザーID
+            story (Story): 保存したストーリー
+        """
+        _latest_story_cache.set((user_id, story.season_id), story, LATEST_STORY_CACHE_TTL)
+
+    async def _get_previous_story(self, user_id: str, season_id: str, chapter_no: int) -> Story:
+        """
+        前章のストーリーを取得（このプロセスで保存したものがあればFirestoreに問い合わせない）
+
+        別のインスタンスで新しい章が保存された場合に古い章を返さないよう、
+        キャッシュは章番号がシーズンの現在の章と一致する場合のみ使用します。
+
+        Args:
+            user_id (str): ユーザーID
+            season_id (str): シーズンID
+            chapter_no (int): 前章の章番号（シーズンのcurrent_chapter）
+        """
+        cached = _latest_story_cache.get((user_id, season_id))
+        if cached is not None and cached.chapter_no == chapter_no:
+            return cached
+
         user_ref = self.db.collection('users').document(user_id)
         season_ref = user_ref.collection('seasons').document(season_id)
         
-        # 最新のストーリーを取得
-        stories = season_ref.collection('stories')\
+        # 最新のストーリーを取得（通信中にイベントループを止めないようスレッドで実行）
+        query = season_ref.collection('stories')\
             .order_by('chapter_no', direction=firestore.Query.DESCENDING)\
-            .limit(1)\
-            .stream()
+            .limit(1)
+        stories = await asyncio.to_thread(query.get)
         
         for story in stories:
-            return Story(**story.to_dict())
+            previous_story = Story(**story.to_dict())
+            _latest_story_cache.set((user_id, season_id), previous_story, LATEST_STORY_CACHE_TTL)
+            return previous_story
         return None
 
     async def get_stories(self, user_id: str, season_id: str) -> List[Story]:
@@ -88,14 +124,13 @@ class StoryService:
         # シーズンの存在確認
         user_ref = self.db.collection('users').document(user_id)
         season_ref = user_ref.collection('seasons').document(season_id)
-        season = season_ref.get()
+        season = await asyncio.to_thread(season_ref.get)
         if not season.exists:
             raise ValueError(f"Season {season_id} not found")
 
         # シーズンのサブコレクションからストーリーを取得
-        stories = season_ref.collection('stories')\
-            .order_by('chapter_no')\
-            .stream()
+        query = season_ref.collection('stories').order_by('chapter_no')
+        stories = await asyncio.to_thread(query.get)
         
         return [Story(**story.to_dict()) for story in stories]
 
@@ -104,12 +139,12 @@ class StoryService:
         # シーズンの存在確認
         user_ref = self.db.collection('users').document(user_id)
         season_ref = user_ref.collection('seasons').document(season_id)
-        season = season_ref.get()
+        season = await asyncio.to_thread(season_ref.get)
         if not season.exists:
             raise ValueError(f"Season {season_id} not found")
 
         # シーズンのサブコレクションからストーリーを取得
-        story = season_ref.collection('stories').document(story_id).get()
+        story = await asyncio.to_thread(season_ref.collection('stories').document(story_id).get)
         if not story.exists:
             raise ValueError("Story not found")
         return Story(**story.to_dict()) 
\ No newline at end of file
@@ -1,3 +1,4 @@
+import asyncio
 from typing import List, Dict
 from google.cloud import firestore
 from fastapi import HTTPException
@@ -7,11 +8,18 @@ from src.services.story_generator import StoryGenerator
 from src.services.category_classifier import CategoryClassifier
 from datetime import datetime
 from google.cloud.firestore import FieldFilter
-from src.utils.encoders import custom_json_response
+from google.api_core.exceptions import NotFound
+from pydantic import TypeAdapter
 import logging
 
 logger = logging.getLogger(__name__)
 
+# 1回のバッチ書き込みに含められる操作数の上限
+FIRESTORE_BATCH_LIMIT = 500
+
+# タスク一覧をまとめて検証する（要素ごとにTask(**...)を呼ぶよりも高速）
+_TASK_LIST_ADAPTER = TypeAdapter(List[Task])
+
 class TaskService:
     def __init__(self, db: firestore.Client):
         self.db = db
@@ -19,6 +27,10 @@ class TaskService:
         self.story_generator = StoryGenerator(db)
         self.category_classifier = CategoryClassifier()
 
+    def _tasks_ref(self, user_id: str) -> firestore.CollectionReference:
+        """ユーザーのタスクコレクションの参照を取得"""
+        return self.db.collection('users').document(user_id).collection('tasks')
+
     async def create_task(self, task: Task, user_id: str) -> Task:
         """
         タスクを作成
@@ -38,19 +50,18 @@ class TaskService:
             task.category = await self.category_classifier.classify_task_category(task.title)
         
         # Firestoreに保存
-        task_ref = self.db.collection('users').document(user_id).collection('tasks').document()
-        task_dict = task.model_dump()
-        task_dict['id'] = task_ref.id
-        task_ref.set(task_dict)
+        task_ref = self._tasks_ref(user_id).document()
+        task.id = task_ref.id
+        await asyncio.to_thread(task_ref.set, task.model_dump())
         
-        logger.info(f"タスクを作成しました: user_id={user_id}, task_id={task_ref.id}, category={task.category}")
-        return Task(**task_dict)
+        logger.info("タスクを作成しました: user_id=%s, task_id=%s, category=%s", user_id, task_ref.id, task.category)
+        return task
 
-    def get_tasks(self, user_id: str) -> List[Task]:
-        """ユーザーのタスク一覧を取得"""
-        tasks_ref = self.db.collection('users').document(user_id).collection('tasks')
-        tasks = tasks_ref.order_by('created_at', direction=firestore.Query.DESCENDING).get()
-        return [Task(**task.to_dict()) for task in tasks]
+    def get_tasks(self, user_id: str) -> List[Dict]:
+        """ユーザーのタスク一覧を取得（読み取り専用のためFirestoreの辞書をそのまま返す）"""
+        tasks_ref = self._tasks_ref(user_id)
+        tasks = tasks_ref.order_by('created_at', direction=firestore.Query.DESCENDING).stream()
+        return [task.to_dict() for task in tasks]
 
     def get_tasks_for_dashboard(self, user_ref: firestore.DocumentReference) -> List[Dict]:
         """ダッシュボード用のタスク一覧を取得（ステータス、期限、完了日時、作成日時でソート）"""
@@ -61,7 +72,7 @@ class TaskService:
 
     def get_task(self, user_id: str, task_id: str) -> Task:
         """特定のタスクを取得"""
-        task_ref = self.db.collection('users').document(user_id).collection('tasks').document(task_id)
+        task_ref = self._tasks_ref(user_id).document(task_id)
         task = task_ref.get()
         if not task.exists:
             raise HTTPException(status_code=404, detail=ErrorMessages.TASK_NOT_FOUND)
@@ -81,52 +92,57 @@ class TaskService:
         Returns:
             Task: 更新されたタスク（カテゴリが設定済み）
         """
-        task_ref = self.db.collection('users').document(user_id).collection('tasks').document(task.id)
-        
-        # タスクの存在確認
-        existing_task = task_ref.get()
-        if not existing_task.exists:
-            logger.warning(f"タスクが存在しません: user_id={user_id}, task_id={task.id}")
-            raise HTTPException(status_code=404, detail=ErrorMessages.TASK_NOT_FOUND)
+        task_ref = self._tasks_ref(user_id).document(task.id)
         
         # カテゴリが設定されていない場合、自動分類を実行
         if task.category is None:
             task.category = await self.category_classifier.classify_task_category(task.title)
             
         task_dict = task.model_dump()
-        task_ref.update(task_dict)
-        logger.info(f"タスクを更新しました: user_id={user_id}, task_id={task.id}, category={task.category}")
+        # タスクが存在しない場合はupdateがNotFoundを送出するため、事前の存在確認は行わない
+        try:
+            await asyncio.to_thread(task_ref.update, task_dict)
+        except NotFound:
+            logger.warning("タスクが存在しません: user_id=%s, task_id=%s", user_id, task.id)
+            raise HTTPException(status_code=404, detail=ErrorMessages.TASK_NOT_FOUND)
+        logger.info("タスクを更新しました: user_id=%s, task_id=%s, category=%s", user_id, task.id, task.category)
         return task
 
     def delete_task(self, task_id: str, user_id: str) -> None:
         """タスクを削除"""
-        task_ref = self.db.collection('users').document(user_id).collection('tasks').document(task_id)
+        task_ref = self._tasks_ref(user_id).document(task_id)
         
-        # タスクの存在確認
-        task = task_ref.get()
-        if not task.exists:
-            logger.warning(f"タスクが存在しません: user_id={user_id}, task_id={task_id}")
+        # タスクを削除（存在しない場合は前提条件によりNotFoundとなるため、事前の存在確認は行わない）
+        try:
+            task_ref.delete(option=self.db.write_option(exists=True))
+        except NotFound:
+            logger.warning("タスクが存在しません: user_id=%s, task_id=%s", user_id, task_id)
             raise HTTPException(status_code=404, detail=ErrorMessages.TASK_NOT_FOUND)
-            
-        # タスクを削除
-        task_ref.delete()
-        logger.info(f"タスクを削除しました: user_id={user_id}, task_id={task_id}")
+        logger.info("タスクを削除しました: user_id=%s, task_id=%s", user_id, task_id)
 
     def get_completed_tasks(self, user_id: str) -> List[Task]:
-        """完了したタスクを取得（経験値獲得済みでないもの）"""
-        tasks_ref = self.db.collection('users').document(user_id).collection('tasks')
+        """
+        完了したタスクを取得（経験値獲得済みでないもの）
+
+        経験値計算・物語生成・一括更新に必要なフィールドのみを取得するため、
+        返されるタスクのそれ以外のフィールドはモデルのデフォルト値になります。
+        """
+        tasks_ref = self._tasks_ref(user_id)
         tasks = tasks_ref.where(filter=FieldFilter("status", "==", TaskStatus.COMPLETED))\
             .where(filter=FieldFilter("experienced_at", "==", None))\
-            .get()
-        return [Task(**task.to_dict()) for task in tasks]
+            .select(['id', 'title', 'status', 'completed_at'])\
+            .stream()
+        return _TASK_LIST_ADAPTER.validate_python([task.to_dict() for task in tasks])
 
     def count_already_done_tasks(self, user_id: str) -> int:
         """当日完了したタスクの数を取得（経験値獲得済みのものを含む）"""
         today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-        tasks_ref = self.db.collection('users').document(user_id).collection('tasks')
+        tasks_ref = self._tasks_ref(user_id)
         query = tasks_ref.where(filter=FieldFilter("completed_at", ">=", today))\
             .where(filter=FieldFilter("experienced_at", ">", datetime.min))
-        return len(list(query.stream()))
+        # ドキュメントを読み込まずに件数のみを集計クエリで取得
+        result = query.count().get()
+        return int(result[0][0].value)
 
     def update_tasks_season_id(self, tasks: List[Task], user_id: str, season_id: str) -> None:
         """
@@ -137,45 +153,72 @@ class TaskService:
             user_id (str): ユーザーID
             season_id (str): シーズンID
         """
-        batch = self.db.batch()
-        for task in tasks:
-            task.season_id = season_id
-            task_ref = self.db.collection('users').document(user_id).collection('tasks').document(task.id)
-            batch.update(task_ref, {'season_id': season_id})
-        batch.commit()
+        tasks_ref = self._tasks_ref(user_id)
+        # 1回のバッチ書き込みの上限（500件）ごとに分けてコミット
+        for start in range(0, len(tasks), FIRESTORE_BATCH_LIMIT):
+            batch = self.db.batch()
+            for task in tasks[start:start + FIRESTORE_BATCH_LIMIT]:
+                task.season_id = season_id
+                batch.update(tasks_ref.document(task.id), {'season_id': season_id})
+            batch.commit()
         
-        logger.info(f"タスクのseason_idを更新しました: user_id={user_id}, task_count={len(tasks)}, season_id={season_id}")
+        logger.info("タスクのseason_idを更新しました: user_id=%s, task_count=%s, season_id=%s", user_id, len(tasks), season_id)
 
-    def update_tasks_to_experienced(self, tasks: List[Task], user_id: str, season_id: str = None) -> None:
+    def add_experienced_updates(self, batch: firestore.WriteBatch, tasks: List[Task], user_id: str, season_id: str = None, now: datetime = None) -> None:
         """
-        タスクを経験値獲得済みに更新
+        タスクを経験値獲得済みにする更新をバッチに追加（コミットは呼び出し元で行う）
+        
+        他の書き込みと同じバッチでコミットすることで、経験値の獲得とタスクの更新を
+        アトミックに反映できます。バッチの操作数の上限は呼び出し元で確認してください。
         
         Args:
+            batch (firestore.WriteBatch): 更新を追加するバッチ
             tasks (List[Task]): 更新するタスクのリスト
             user_id (str): ユーザーID
             season_id (str, optional): シーズンID（指定された場合、タスクのseason_idも更新）
+            now (datetime, optional): experienced_atに設定する日時（省略時は現在日時）
         """
-        batch = self.db.batch()
+        now = now or datetime.now()
+        # タスク全体を書き戻さず、変更したフィールドのみを送る
+        update_data = {'experienced_at': now}
+        if season_id:
+            update_data['season_id'] = season_id
+
+        tasks_ref = self._tasks_ref(user_id)
         for task in tasks:
-            task.experienced_at = datetime.now()
+            # 呼び出し元が参照するメモリ上のタスクにも反映
+            task.experienced_at = now
             # season_idが指定された場合、タスクのseason_idも更新
             if season_id:
                 task.season_id = season_id
-            
-            task_ref = self.db.collection('users').document(user_id).collection('tasks').document(task.id)
-            batch.update(task_ref, task.model_dump())
-        batch.commit()
+            batch.update(tasks_ref.document(task.id), update_data)
+
+    def update_tasks_to_experienced(self, tasks: List[Task], user_id: str, season_id: str = None) -> None:
+        """
+        タスクを経験値獲得済みに更新
         
-        logger.info(f"タスクを経験値獲得済みに更新しました: user_id={user_id}, task_count={len(tasks)}, season_id={season_id}")
+        Args:
+            tasks (List[Task]): 更新するタスクのリスト
+            user_id (str): ユーザーID
+            season_id (str, optional): シーズンID（指定された場合、タスクのseason_idも更新）
+        """
+        now = datetime.now()
+        # 1回のバッチ書き込みの上限（500件）ごとに分けてコミット
+        for start in range(0, len(tasks), FIRESTORE_BATCH_LIMIT):
+            batch = self.db.batch()
+            self.add_experienced_updates(batch, tasks[start:start + FIRESTORE_BATCH_LIMIT], user_id, season_id, now)
+            batch.commit()
+        
+        logger.info("タスクを経験値獲得済みに更新しました: user_id=%s, task_count=%s, season_id=%s", user_id, len(tasks), season_id)
 
     def update_task_status(self, task_id: str, status: TaskStatus, user_id: str) -> Task:
         """タスクのステータスのみを更新"""
-        task_ref = self.db.collection('users').document(user_id).collection('tasks').document(task_id)
+        task_ref = self._tasks_ref(user_id).document(task_id)
         
         # タスクの存在確認
         task = task_ref.get()
         if not task.exists:
-            logger.warning(f"タスクが存在しません: user_id={user_id}, task_id={task_id}")
+            logger.warning("タスクが存在しません: user_id=%s, task_id=%s", user_id, task_id)
             raise HTTPException(status_code=404, detail=ErrorMessages.TASK_NOT_FOUND)
             
         # 更新データの準備
@@ -190,8 +233,7 @@ class TaskService:
             
         # タスクを更新
         task_ref.update(update_data)
-        logger.info(f"タスクステータスを更新しました: user_id={user_id}, task_id={task_id}, status={status}")
+        logger.info("タスクステータスを更新しました: user_id=%s, task_id=%s, status=%s", user_id, task_id, status)
         
-        # 更新後のタスクを取得して返す
-        updated_task = task_ref.get()
-        return Task(**updated_task.to_dict())
\ No newline at end of file
+        # 更新内容を反映したタスクを返す（再取得は行わない）
+        return Task(**{**task.to_dict(), **update_data})
\ No newline at end of file
@@ -1,13 +1,44 @@
 from fastapi import Request, HTTPException
 from firebase_admin import auth
 import os
-from typing import Optional
+import time
+import asyncio
+import hashlib
+from typing import Optional, Dict, Tuple
 from src.models.types import ErrorMessages
 
+# 検証済みトークンのキャッシュ（トークンのハッシュ -> (ユーザーID, 有効期限)）
+_TOKEN_CACHE: Dict[bytes, Tuple[str, float]] = {}
+_TOKEN_CACHE_MAX_SIZE = 4096
+# 有効期限間近のトークンはキャッシュを使わずに再検証する（秒）
+_TOKEN_EXPIRY_MARGIN = 30
+_BEARER_PREFIX = 'Bearer '
+
+def _get_cached_user_id(token_key: bytes) -> Optional[str]:
+    """キャッシュから有効な検証済みトークンのユーザーIDを取得する"""
+    cached = _TOKEN_CACHE.get(token_key)
+    if cached is None:
+        return None
+    user_id, exp = cached
+    if exp <= time.time() + _TOKEN_EXPIRY_MARGIN:
+        _TOKEN_CACHE.pop(token_key, None)
+        return None
+    return user_id
+
+def _cache_user_id(token_key: bytes, user_id: str, exp: float) -> None:
+    """検証済みトークンのユーザーIDをキャッシュする"""
+    if len(_TOKEN_CACHE) >= _TOKEN_CACHE_MAX_SIZE:
+        # 期限切れのエントリを削除し、それでも上限なら最も古いエントリを削除
+        now = time.time()
+        for key in [key for key, (_, cached_exp) in _TOKEN_CACHE.items() if cached_exp <= now]:
+            del _TOKEN_CACHE[key]
+        if len(_TOKEN_CACHE) >= _TOKEN_CACHE_MAX_SIZE:
+            del _TOKEN_CACHE[next(iter(_TOKEN_CACHE))]
+    _TOKEN_CACHE[token_key] = (user_id, exp)
+
 async def verify_token(request: Request) -> str:
     """Firebaseの認証トークンを検証する関数"""
     try:
-        print(f"ENVIRONMENT: {os.getenv('ENVIRONMENT')}")
         # テスト環境の場合は認証をスキップ
         if os.getenv("ENVIRONMENT") == "test":
             # テスト用のユーザーIDを返す
@@ -15,22 +46,28 @@ async def verify_token(request: Request) -> str:
 
         # Authorizationヘッダーからトークンを取得
         auth_header = request.headers.get('Authorization')
-        if not auth_header or not auth_header.startswith('Bearer '):
+        if not auth_header or not auth_header.startswith(_BEARER_PREFIX):
             raise HTTPException(
                 status_code=401,
                 detail=ErrorMessages.UNAUTHORIZED
             )
 
         # トークンを取得
-        token = auth_header.split('Bearer ')[1]
+        token = auth_header[len(_BEARER_PREFIX):]
         if not token:
             raise HTTPException(
                 status_code=401,
                 detail=ErrorMessages.UNAUTHORIZED
             )
 
-        # トークンを検証
-        decoded_token = auth.verify_id_token(token)
+        # 検証済みのトークンであればキャッシュから返す
+        token_key = hashlib.blake2b(token.encode(), digest_size=16).digest()
+        user_id = _get_cached_user_id(token_key)
+        if user_id:
+            return user_id
+
+        # トークンを検証（公開鍵の取得で通信が発生し得るためスレッドで実行）
+        decoded_token = await asyncio.to_thread(auth.verify_id_token, token)
         user_id = decoded_token.get('uid')
         if not user_id:
             raise HTTPException(
@@ -38,8 +75,12 @@ async def verify_token(request: Request) -> str:
                 detail=ErrorMessages.UNAUTHORIZED
             )
 
+        _cache_user_id(token_key, user_id, decoded_token.get('exp', 0))
         return user_id
-    except Exception as e:
+    except HTTPException:
+        raise
+    except (auth.InvalidIdTokenError, ValueError):
+        # 不正・期限切れ・失効したトークン（ValueErrorは形式が不正な場合）
         raise HTTPException(
             status_code=401,
             detail=ErrorMessages.UNAUTHORIZED
@@ -0,0 +1,125 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+
+class TTLCache:
+    """
+    有効期限付きのインメモリキャッシュ
+
+    同じキーに対する取得処理が同時に複数走った場合は、最初の1件の結果を
+    後続の呼び出しでも待ち受けて共有します（in-flightの重複排除）。
+    エントリ数がmax_entriesに達した場合は、期限切れのエントリを削除したうえで
+    最も長く参照されていないエントリから破棄します（LRU）。
+
+    Attributes:
+        max_entries: 保持するエントリ数の上限
+    """
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        # キー -> (失効時刻, 値)
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        # キー -> 取得中の結果を待ち受けるFuture
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        有効期限内の値を取得する
+
+        Args:
+            key (Hashable): キャッシュキー
+            default (Any): キャッシュがない場合の戻り値
+
+        Returns:
+            Any: キャッシュされた値（存在しないか期限切れの場合はdefault）
+        """
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        if entry[0] <= time.monotonic():
+            self._data.pop(key, None)
+            return default
+        self._data.move_to_end(key)
+        return entry[1]
+
+    def set(self, key: Hashable, value: Any, ttl: float) -> None:
+        """
+        値をキャッシュに保存する
+
+        Args:
+            key (Hashable): キャッシュキー
+            value (Any): 保存する値
+            ttl (float): 有効期間（秒）
+        """
+        now = time.monotonic()
+        if key not in self._data and len(self._data) >= self.max_entries:
+            self._purge_expired(now)
+            # 期限切れを削除しても上限に達している場合は最も古いエントリを破棄
+            while len(self._data) >= self.max_entries:
+                self._data.popitem(last=False)
+        self._data[key] = (now + ttl, value)
+        self._data.move_to_end(key)
+
+    def invalidate(self, key: Hashable) -> None:
+        """
+        キャッシュを無効化する
+
+        取得中の処理がある場合、その結果はキャッシュに保存されません。
+
+        Args:
+            key (Hashable): キャッシュキー
+        """
+        self._data.pop(key, None)
+        self._inflight.pop(key, None)
+
+    async def get_or_fetch(self, key: Hashable, ttl: float, coro_factory: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        キャッシュから値を取得し、なければ取得処理を実行して保存する
+
+        Args:
+            key (Hashable): キャッシュキー
+            ttl (float): 有効期間（秒）
+            coro_factory (Callable[[], Awaitable[Any]]): 値を取得するコルーチンを返す関数
+
+        Returns:
+            Any: キャッシュされた値または新たに取得した値
+        """
+        entry = self._data.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self._data.move_to_end(key)
+            return entry[1]
+
+        # 同じキーを取得中であれば、その結果を待つ
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await coro_factory()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # 待ち受ける呼び出しがない場合に未取得の例外として警告されないようにする
+            future.exception()
+            raise
+        else:
+            # 取得中に無効化された場合は保存しない
+            if self._inflight.get(key) is future:
+                self.set(key, value, ttl)
+            future.set_result(value)
+            return value
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    def _purge_expired(self, now: Optional[float] = None) -> None:
+        """期限切れのエントリを削除する"""
+        now = time.monotonic() if now is None else now
+        for key in [key for key, (expires_at, _) in self._data.items() if expires_at <= now]:
+            del self._data[key]
@@ -1,33 +1,35 @@
+from functools import singledispatch
 from typing import Any
 from datetime import datetime
 from google.cloud import firestore
-from fastapi.encoders import jsonable_encoder
-from fastapi.responses import JSONResponse
-from google.cloud.firestore_v1._helpers import DatetimeWithNanoseconds
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
-import json
+import orjson
 
+@singledispatch
 def custom_encoder(obj: Any) -> Any:
-    """カスタムエンコーダー"""
-    if isinstance(obj, (datetime, DatetimeWithNanoseconds)):
-        return obj.isoformat()
-    if isinstance(obj, BaseModel):
-        return obj.model_dump()
+    """カスタムエンコーダー（orjsonが直接扱えない型を変換する）"""
     return obj
 
-class CustomJSONEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, (datetime, DatetimeWithNanoseconds)):
-            return obj.isoformat()
-        return super().default(obj)
+@custom_encoder.register
+def _(obj: datetime) -> str:
+    # DatetimeWithNanosecondsはdatetimeのサブクラスのためここで処理される
+    return obj.isoformat()
 
-def custom_json_response(content: Any) -> JSONResponse:
-    """カスタムJSONレスポンスの生成"""
-    if isinstance(content, BaseModel):
-        content = content.model_dump()
-    elif isinstance(content, dict):
-        content = {k: custom_encoder(v) for k, v in content.items()}
-    else:
-        content = custom_encoder(content)
-    
-    return JSONResponse(content=jsonable_encoder(content)) 
\ No newline at end of file
+@custom_encoder.register
+def _(obj: BaseModel) -> Any:
+    return obj.model_dump()
+
+class CustomORJSONResponse(ORJSONResponse):
+    """orjsonベースのJSONレスポンス（Firestoreの日時型やPydanticモデルにも対応）"""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(
+            content,
+            default=custom_encoder,
+            option=orjson.OPT_NON_STR_KEYS
+        )
+
+def custom_json_response(content: Any) -> CustomORJSONResponse:
+    """カスタムJSONレスポンスの生成（日時型・Pydanticモデルはorjsonのdefaultで変換）"""
+    return CustomORJSONResponse(content=content) 
\ No newline at end of file
@@ -15,9 +15,10 @@ def initialize_firebase():
             os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
         )
         
-        # Firebase Admin SDKの初期化
-        firebase_admin.initialize_app(cred)
-        print("Firebase Admin SDKの初期化が成功しました")
+        # Firebase Admin SDKの初期化（モジュールの再読み込み時に二重に初期化しない）
+        if not firebase_admin._apps:
+            firebase_admin.initialize_app(cred)
+            print("Firebase Admin SDKの初期化が成功しました")
         
         # Firestoreクライアントの取得
         db = firestore.client()
@@ -28,5 +29,18 @@ def initialize_firebase():
         print(f"Firebase初期化エラー: {str(e)}")
         raise
 
+def warm_up_firestore() -> None:
+    """
+    Firestoreに最小限の読み取りを行い、gRPCチャネルを事前に確立する
+
+    最初のユーザーリクエストで接続確立の待ち時間が発生しないよう、
+    起動時にバックグラウンドで実行します。失敗してもアプリケーションの動作には影響しません。
+    """
+    try:
+        db.collection('_warmup').document('_').get()
+        print("Firestoreのウォームアップが完了しました")
+    except Exception as e:
+        print(f"Firestoreのウォームアップに失敗しました: {str(e)}")
+
 # グローバル変数としてdbを初期化
 db = initialize_firebase() 
\ No newline at end of file
@@ -0,0 +1,111 @@
+import asyncio
+import logging
+import os
+import random
+import threading
+from typing import Any, Dict, Optional, Set, Tuple
+import vertexai
+from google.api_core.exceptions import ResourceExhausted
+from vertexai.preview.generative_models import GenerationConfig, GenerativeModel
+
+logger = logging.getLogger(__name__)
+
+# (プロジェクトID, リージョン, モデル名, システム指示) -> GenerativeModel
+_MODEL_CACHE: Dict[Tuple[Optional[str], Optional[str], Optional[str], Optional[str]], GenerativeModel] = {}
+# vertexai.init済みの (プロジェクトID, リージョン)
+_INITIALIZED: Set[Tuple[Optional[str], Optional[str]]] = set()
+_lock = threading.Lock()
+# GenerativeModel -> 同時リクエスト数を制限するセマフォ
+_SEMAPHORES: Dict[GenerativeModel, asyncio.Semaphore] = {}
+
+# クォータ超過（429）時の再試行回数と初回の待機時間（秒）
+VERTEX_MAX_RETRIES = 3
+VERTEX_RETRY_BASE_DELAY = 0.5
+
+def get_generative_model(project_id: Optional[str], location: Optional[str], model_name: Optional[str], system_instruction: Optional[str] = None) -> GenerativeModel:
+    """
+    共有のGenerativeModelを取得する
+
+    サービスのインスタンスごとにVertex AIを初期化しないよう、
+    (プロジェクトID, リージョン, モデル名, システム指示) ごとに1つのモデルを生成して使い回します。
+
+    Args:
+        project_id (Optional[str]): Google Cloud プロジェクトID
+        location (Optional[str]): Vertex AIのリージョン
+        model_name (Optional[str]): 使用するモデル名
+        system_instruction (Optional[str]): モデルに設定するシステム指示
+
+    Returns:
+        GenerativeModel: 共有のモデルインスタンス
+    """
+    key = (project_id, location, model_name, system_instruction)
+    model = _MODEL_CACHE.get(key)
+    if model is not None:
+        return model
+
+    with _lock:
+        model = _MODEL_CACHE.get(key)
+        if model is None:
+            if (project_id, location) not in _INITIALIZED:
+                # gRPCのチャネルはモデル間で共有され、接続が使い回される
+                vertexai.init(
+                    project=project_id,
+                    location=location,
+                    api_transport="grpc"
+                )
+                _INITIALIZED.add((project_id, location))
+            model = GenerativeModel(model_name, system_instruction=system_instruction)
+            _MODEL_CACHE[key] = model
+            logger.info("Vertex AIモデルを初期化しました: %s (%s)", model_name, location)
+    return model
+
+async def generate_content(model: GenerativeModel, contents: Any, generation_config: Optional[GenerationConfig] = None) -> Any:
+    """
+    同時実行数を制限してモデルにコンテンツ生成を依頼する
+
+    モデルごとに同時リクエスト数をVERTEX_MAX_CONCURRENCY（デフォルト8）までに制限し、
+    クォータ超過（ResourceExhausted）の場合はジッター付きの指数バックオフで再試行します。
+
+    Args:
+        model (GenerativeModel): 使用するモデル
+        contents (Any): プロンプト
+        generation_config (Optional[GenerationConfig]): 生成設定
+
+    Returns:
+        Any: モデルのレスポンス
+
+    Raises:
+        ResourceExhausted: 再試行してもクォータ超過が解消しない場合
+    """
+    semaphore = _SEMAPHORES.get(model)
+    if semaphore is None:
+        semaphore = _SEMAPHORES.setdefault(
+            model, asyncio.Semaphore(int(os.getenv("VERTEX_MAX_CONCURRENCY", "8")))
+        )
+
+    for attempt in range(VERTEX_MAX_RETRIES + 1):
+        try:
+            async with semaphore:
+                return await model.generate_content_async(contents, generation_config=generation_config)
+        except ResourceExhausted as e:
+            if attempt == VERTEX_MAX_RETRIES:
+                raise
+            delay = VERTEX_RETRY_BASE_DELAY * (2 ** attempt) * (1 + random.random())
+            logger.warning("Vertex AIのクォータを超過しました。%.1f秒後に再試行します: %s", delay, e)
+            await asyncio.sleep(delay)
+
+async def warm_up_models() -> None:
+    """
+    生成済みのモデルに最小限のリクエストを送り、接続を事前に確立する
+
+    最初のユーザーリクエストでTLSハンドシェイクやチャネル確立の
+    待ち時間が発生しないよう、起動時にバックグラウンドで実行します。
+    失敗してもアプリケーションの動作には影響しません。
+    """
+    generation_config = GenerationConfig(max_output_tokens=1)
+    for (_, location, model_name, _), model in list(_MODEL_CACHE.items()):
+        try:
+            await model.generate_content_async("ping", generation_config=generation_config)
+            logger.info("Vertex AIモデルのウォームアップが完了しました: %s (%s)", model_name, location)
+        except Exception as e:
+            logger.warning("Vertex AIモデルのウォームアップに失敗しました: %s (%s): %s", model_name, location, e)